@@ -103,4 +103,87 @@ STATIC_URL = "static/"
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
-DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
\ No newline at end of file
+DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+# Embedding generation (generate_embeddings.py): datasets read, encoded and committed per chunk,
+# rows upserted per bulk statement, and the file recording the last committed dataset id so an
+# interrupted run resumes where it stopped
+EMBEDDING_READ_CHUNK_SIZE = config('EMBEDDING_READ_CHUNK_SIZE', default=2000, cast=int)
+EMBEDDING_WRITE_CHUNK_SIZE = config('EMBEDDING_WRITE_CHUNK_SIZE', default=1000, cast=int)
+EMBEDDING_CHECKPOINT_PATH = config('EMBEDDING_CHECKPOINT_PATH', default=str(BASE_DIR / 'embedding_checkpoint.json'))
+# BERT encoding of the corpus: worker processes (0 or 1 encodes in-process), torch threads per
+# worker (0 splits the cores evenly), and texts per length-bucketed batch
+EMBEDDING_ENCODE_WORKERS = config('EMBEDDING_ENCODE_WORKERS', default=0, cast=int)
+EMBEDDING_ENCODE_THREADS = config('EMBEDDING_ENCODE_THREADS', default=0, cast=int)
+EMBEDDING_ENCODE_BATCH_SIZE = config('EMBEDDING_ENCODE_BATCH_SIZE', default=32, cast=int)
+
+# Query processing
+# Seconds between checks of the Embedding table watermark by the in-memory index
+EMBEDDING_INDEX_REFRESH_SECONDS = config('EMBEDDING_INDEX_REFRESH_SECONDS', default=30, cast=float)
+# Where the in-memory index is loaded from: 'database' (the Embedding table) or 'snapshot'
+# (the memory-mapped file written by `manage.py write_embedding_snapshot`, shared by all
+# workers); EMBEDDING_SNAPSHOT_VERIFY checks its checksum on every (re)map
+EMBEDDING_INDEX_SOURCE = config('EMBEDDING_INDEX_SOURCE', default='database')
+EMBEDDING_SNAPSHOT_PATH = config('EMBEDDING_SNAPSHOT_PATH', default=str(BASE_DIR / 'embedding_index.snapshot'))
+EMBEDDING_SNAPSHOT_VERIFY = config('EMBEDDING_SNAPSHOT_VERIFY', default=False, cast=bool)
+# Number of ranked datasets returned by /api/query/ when top_k is not given, and its upper bound
+QUERY_DEFAULT_TOP_K = config('QUERY_DEFAULT_TOP_K', default=20, cast=int)
+QUERY_MAX_TOP_K = config('QUERY_MAX_TOP_K', default=1000, cast=int)
+# BERT similarity search: 'exact' scores every row, 'ivf' probes the IVF index built by
+# `manage.py build_ann_index`; BERT_ANN_NPROBE trades latency for recall
+BERT_SEARCH_BACKEND = config('BERT_SEARCH_BACKEND', default='exact')
+BERT_ANN_INDEX_PATH = config('BERT_ANN_INDEX_PATH', default=str(BASE_DIR / 'bert_ivf_index.npz'))
+BERT_ANN_NLIST = config('BERT_ANN_NLIST', default=0, cast=int)  # 0 picks 4 * sqrt(N)
+BERT_ANN_NPROBE = config('BERT_ANN_NPROBE', default=8, cast=int)
+# In-memory BERT matrix: 'none' (float32), 'float16', 'int8' (per-vector scale) or 'pq'
+# (product quantization); see `manage.py quantization_report` for memory vs recall.
+# BERT_RERANK_CANDIDATES > 0 re-scores that many best candidates with full-precision vectors
+BERT_QUANTIZATION = config('BERT_QUANTIZATION', default='none')
+BERT_PQ_SUBVECTORS = config('BERT_PQ_SUBVECTORS', default=48, cast=int)
+BERT_PQ_CODEWORDS = config('BERT_PQ_CODEWORDS', default=256, cast=int)
+BERT_RERANK_CANDIDATES = config('BERT_RERANK_CANDIDATES', default=0, cast=int)
+# Lexical (TF-IDF) leg: 'cosine' multiplies the sparse matrices, 'tfidf' and 'bm25' use the
+# inverted index; LEXICAL_TOP_K > 0 keeps only the exact top rows via MaxScore pruning
+LEXICAL_BACKEND = config('LEXICAL_BACKEND', default='cosine')
+LEXICAL_TOP_K = config('LEXICAL_TOP_K', default=0, cast=int)
+BM25_K1 = config('BM25_K1', default=1.2, cast=float)
+BM25_B = config('BM25_B', default=0.75, cast=float)
+# Query encoders and the LRU cache of their outputs (entries; TTL in seconds, 0 = no expiry)
+TFIDF_VECTORIZER_PATH = config('TFIDF_VECTORIZER_PATH', default=str(BASE_DIR / 'tfidf_vectorizer.pkl'))
+BERT_MODEL_NAME = config('BERT_MODEL_NAME', default='all-MiniLM-L6-v2')
+QUERY_EMBEDDING_CACHE_SIZE = config('QUERY_EMBEDDING_CACHE_SIZE', default=1024, cast=int)
+QUERY_EMBEDDING_CACHE_TTL = config('QUERY_EMBEDDING_CACHE_TTL', default=3600, cast=float)
+# Cache of full /api/query/ responses: 'locmem' (per process), 'django' (the CACHES alias
+# below, shared between processes) or 'none'
+QUERY_RESULT_CACHE_BACKEND = config('QUERY_RESULT_CACHE_BACKEND', default='locmem')
+QUERY_RESULT_CACHE_ALIAS = config('QUERY_RESULT_CACHE_ALIAS', default='default')
+QUERY_RESULT_CACHE_SIZE = config('QUERY_RESULT_CACHE_SIZE', default=512, cast=int)
+QUERY_RESULT_CACHE_TTL = config('QUERY_RESULT_CACHE_TTL', default=600, cast=float)
+# /api/query/batch/: maximum queries per request, and queries scored per matrix product
+QUERY_BATCH_MAX_QUERIES = config('QUERY_BATCH_MAX_QUERIES', default=5000, cast=int)
+QUERY_BATCH_CHUNK_SIZE = config('QUERY_BATCH_CHUNK_SIZE', default=256, cast=int)
+# /api/query/stream/ (NDJSON): deepest result list allowed, and results serialized per chunk
+QUERY_STREAM_MAX_TOP_K = config('QUERY_STREAM_MAX_TOP_K', default=100000, cast=int)
+QUERY_STREAM_CHUNK_SIZE = config('QUERY_STREAM_CHUNK_SIZE', default=500, cast=int)
+# Searches are logged to Query/QueryResult by a background writer: flushed every FLUSH_ITEMS
+# entries or FLUSH_MS, at most MAX_QUEUE waiting (extra entries are dropped), MAX_RESULTS kept per query
+QUERY_LOGGING_ENABLED = config('QUERY_LOGGING_ENABLED', default=True, cast=bool)
+QUERY_LOG_FLUSH_ITEMS = config('QUERY_LOG_FLUSH_ITEMS', default=100, cast=int)
+QUERY_LOG_FLUSH_MS = config('QUERY_LOG_FLUSH_MS', default=1000, cast=float)
+QUERY_LOG_MAX_QUEUE = config('QUERY_LOG_MAX_QUEUE', default=10000, cast=int)
+QUERY_LOG_MAX_RESULTS = config('QUERY_LOG_MAX_RESULTS', default=20, cast=int)
+# Load encoders and indexes on a background thread, started by each worker's first /api/ready/ check
+QUERY_WARMUP_ON_STARTUP = config('QUERY_WARMUP_ON_STARTUP', default=True, cast=bool)
+# After that warmup, rank the most frequent logged queries (of the last PREWARM_DAYS, 0 = all)
+# to fill the embedding and result caches before reporting ready; budget in queries and seconds
+QUERY_PREWARM_ON_STARTUP = config('QUERY_PREWARM_ON_STARTUP', default=False, cast=bool)
+QUERY_PREWARM_MAX_QUERIES = config('QUERY_PREWARM_MAX_QUERIES', default=500, cast=int)
+QUERY_PREWARM_MAX_SECONDS = config('QUERY_PREWARM_MAX_SECONDS', default=30, cast=float)
+QUERY_PREWARM_DAYS = config('QUERY_PREWARM_DAYS', default=30, cast=int)
+# Coalesce concurrent single-query BERT encodes: wait up to WINDOW_MS for up to MAX_BATCH texts
+QUERY_BATCHING_ENABLED = config('QUERY_BATCHING_ENABLED', default=False, cast=bool)
+QUERY_BATCHING_WINDOW_MS = config('QUERY_BATCHING_WINDOW_MS', default=3.0, cast=float)
+QUERY_BATCHING_MAX_BATCH = config('QUERY_BATCHING_MAX_BATCH', default=32, cast=int)
+# /api/query/async/: threads encoding/scoring queries, and requests allowed to wait for one
+QUERY_ASYNC_MAX_WORKERS = config('QUERY_ASYNC_MAX_WORKERS', default=4, cast=int)
+QUERY_ASYNC_MAX_QUEUE = config('QUERY_ASYNC_MAX_QUEUE', default=64, cast=int)
@@ -1,7 +1,27 @@
 from django.contrib import admin
-from .models import Metadata, Embedding, Query, QueryResult
+from .models import Metadata, Embedding, EmbeddingVector, Query, QueryResult
 
 admin.site.register(Metadata)
 admin.site.register(Embedding)
 admin.site.register(Query)
-admin.site.register(QueryResult)
\ No newline at end of file
+admin.site.register(QueryResult)
+
+
+@admin.register(EmbeddingVector)
+class EmbeddingVectorAdmin(admin.ModelAdmin):
+    """
+    Read-only: vectors are shared between embeddings and written by
+    generate_embeddings.py, and saving one here would not reach the search
+    index, which only watches Embedding and Metadata.
+    """
+
+    list_display = ('id', 'content_hash', 'encoder_version', 'bert_dim', 'tfidf_dim', 'created_at')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
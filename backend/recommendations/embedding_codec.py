@@ -0,0 +1,43 @@
+"""
+Binary encoding of embedding vectors stored on ``Embedding``.
+
+Vectors are kept as raw little-endian arrays so readers can decode them with
+``np.frombuffer`` instead of parsing JSON floats one by one. TF-IDF vectors
+are sparse and stored as two arrays: int32 column indices and their weights.
+"""
+import numpy as np
+
+DEFAULT_DTYPE = 'float32'
+INDEX_DTYPE = np.dtype('<i4')
+
+
+def _value_dtype(dtype):
+    return np.dtype(dtype).newbyteorder('<')
+
+
+def encode_dense(vector, dtype=DEFAULT_DTYPE):
+    """Return ``(bytes, dim)`` for a 1-D dense vector."""
+    vector = np.ascontiguousarray(vector, dtype=_value_dtype(dtype)).ravel()
+    return vector.tobytes(), vector.shape[0]
+
+
+def decode_dense(data, dtype=DEFAULT_DTYPE):
+    """Return a read-only 1-D array viewing ``data``."""
+    return np.frombuffer(data, dtype=_value_dtype(dtype))
+
+
+def encode_sparse(indices, values, dtype=DEFAULT_DTYPE):
+    """Return ``(indices_bytes, values_bytes)`` for the non-zero entries of a vector."""
+    indices = np.ascontiguousarray(indices, dtype=INDEX_DTYPE)
+    values = np.ascontiguousarray(values, dtype=_value_dtype(dtype))
+    if indices.shape != values.shape:
+        raise ValueError("Sparse indices and values must have the same length.")
+    return indices.tobytes(), values.tobytes()
+
+
+def decode_sparse(indices_data, values_data, dtype=DEFAULT_DTYPE):
+    """Return ``(indices, values)`` arrays viewing the stored buffers."""
+    return (
+        np.frombuffer(indices_data, dtype=INDEX_DTYPE),
+        np.frombuffer(values_data, dtype=_value_dtype(dtype)),
+    )
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recommendations.query_processing.ann_index import IVFIndex, evaluate_recall
+from recommendations.query_processing.embedding_index import EmbeddingIndex
+
+
+class Command(BaseCommand):
+    help = "Build the IVF index for BERT embeddings and report recall@k against exact search."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=str(settings.BERT_ANN_INDEX_PATH))
+        parser.add_argument('--nlist', type=int, default=settings.BERT_ANN_NLIST,
+                            help="Number of k-means lists (0 picks 4 * sqrt(N)).")
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--k', type=int, default=10, help="Cut-off for the recall@k report.")
+        parser.add_argument('--nprobe', default='1,2,4,8,16,32',
+                            help="Comma-separated nprobe values to evaluate.")
+        parser.add_argument('--eval-queries', type=int, default=200,
+                            help="Number of sampled corpus vectors used as queries (0 skips the report).")
+
+    def handle(self, *args, **options):
+        data = EmbeddingIndex(refresh_interval=0, quantization='none').get()
+        if len(data) == 0:
+            raise CommandError("The Embedding table is empty.")
+
+        ann = IVFIndex.build(data.bert_matrix, data.dataset_ids,
+                             n_lists=options['nlist'], n_iter=options['iterations'])
+        ann.save(options['output'])
+        self.stdout.write(f"Saved IVF index with {ann.n_lists} lists over {len(data)} vectors "
+                          f"to {options['output']}")
+
+        if options['eval_queries'] <= 0:
+            return
+        nprobes = [int(value) for value in options['nprobe'].split(',') if value]
+        exact_ms, report = evaluate_recall(ann, data.bert_matrix, data.dataset_ids, k=options['k'],
+                                           nprobes=nprobes, n_queries=options['eval_queries'])
+        self.stdout.write(f"exact search: {exact_ms:.3f} ms/query")
+        self.stdout.write(f"{'nprobe':>8} {'recall@' + str(options['k']):>10} {'ms/query':>10} {'scanned':>9}")
+        for row in report:
+            self.stdout.write(f"{row['nprobe']:>8} {row['recall']:>10.3f} "
+                              f"{row['latency_ms']:>10.3f} {row['scanned']:>9.1%}")
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recommendations.query_processing.prewarm import prewarm_caches
+
+
+class Command(BaseCommand):
+    help = "Rank the most frequent logged queries to pre-populate the query caches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-queries', type=int, default=settings.QUERY_PREWARM_MAX_QUERIES)
+        parser.add_argument('--max-seconds', type=float, default=settings.QUERY_PREWARM_MAX_SECONDS,
+                            help="Time budget (0 = no limit).")
+        parser.add_argument('--days', type=int, default=settings.QUERY_PREWARM_DAYS,
+                            help="Only consider queries logged in the last N days (0 = all).")
+        parser.add_argument('--top-k', type=int, default=settings.QUERY_DEFAULT_TOP_K)
+
+    def handle(self, *args, **options):
+        if settings.QUERY_RESULT_CACHE_BACKEND != 'django':
+            self.stderr.write(
+                f"QUERY_RESULT_CACHE_BACKEND is '{settings.QUERY_RESULT_CACHE_BACKEND}': results cached by "
+                "this command stay in this process. Use the 'django' backend to share them with the "
+                "servers, or set QUERY_PREWARM_ON_STARTUP to warm each worker."
+            )
+        report = prewarm_caches(max_queries=options['max_queries'], max_seconds=options['max_seconds'],
+                                days=options['days'], top_k=options['top_k'])
+        self.stdout.write(f"Warmed {report['queries']} of {report['candidates']} popular queries "
+                          f"in {report['seconds']}s")
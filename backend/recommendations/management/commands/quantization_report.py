@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recommendations.query_processing.embedding_index import EmbeddingIndex
+from recommendations.query_processing.quantization import evaluate_quantization
+
+
+class Command(BaseCommand):
+    help = "Report memory saved versus recall@k lost by each BERT quantization scheme."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--schemes', default='none,float16,int8,pq',
+                            help="Comma-separated schemes to evaluate.")
+        parser.add_argument('--k', type=int, default=10, help="Cut-off for the recall@k report.")
+        parser.add_argument('--rerank', type=int, default=settings.BERT_RERANK_CANDIDATES or 100,
+                            help="Candidates re-scored in full precision (0 skips re-ranking).")
+        parser.add_argument('--queries', type=int, default=200,
+                            help="Number of sampled corpus vectors used as queries.")
+        parser.add_argument('--pq-subvectors', type=int, default=settings.BERT_PQ_SUBVECTORS)
+        parser.add_argument('--pq-codewords', type=int, default=settings.BERT_PQ_CODEWORDS)
+
+    def handle(self, *args, **options):
+        data = EmbeddingIndex(refresh_interval=0, quantization='none').get()
+        if len(data) < 2:
+            raise CommandError("The Embedding table needs at least two rows.")
+
+        schemes = [scheme for scheme in options['schemes'].split(',') if scheme]
+        k = options['k']
+        report = evaluate_quantization(
+            data.bert_matrix, schemes, k=k, rerank=options['rerank'], n_queries=options['queries'],
+            pq_subvectors=options['pq_subvectors'], pq_codewords=options['pq_codewords'],
+        )
+
+        self.stdout.write(f"{len(data)} vectors, {data.bert_matrix.shape[1]} dims, recall@{k}")
+        header = f"{'scheme':>8} {'MB':>9} {'ratio':>7} {'build s':>8} {'recall':>7} {'ms/query':>9}"
+        if options['rerank']:
+            header += f" {'reranked':>9} {'rerank ms':>10}"
+        self.stdout.write(header)
+        for row in report:
+            line = (f"{row['scheme']:>8} {row['bytes'] / 2 ** 20:>9.2f} {row['compression']:>6.1f}x "
+                    f"{row['build_seconds']:>8.2f} {row['recall']:>7.3f} {row['latency_ms']:>9.3f}")
+            if options['rerank']:
+                line += f" {row['reranked_recall']:>9.3f} {row['rerank_ms']:>10.3f}"
+            self.stdout.write(line)
@@ -0,0 +1,33 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recommendations.query_processing.embedding_index import EmbeddingIndex
+from recommendations.query_processing.snapshot import write_snapshot
+
+
+class Command(BaseCommand):
+    help = "Write the memory-mapped embedding index snapshot from the Embedding table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=str(settings.EMBEDDING_SNAPSHOT_PATH))
+        parser.add_argument('--no-texts', action='store_true',
+                            help="Leave out combined_normalized_text (only needed for BM25 scoring).")
+
+    def handle(self, *args, **options):
+        if options['no_texts'] and settings.LEXICAL_BACKEND == 'bm25':
+            raise CommandError("LEXICAL_BACKEND is 'bm25', which scores the texts; drop --no-texts.")
+        started = time.perf_counter()
+        data = EmbeddingIndex(refresh_interval=0, quantization='none', source='database',
+                              load_texts=not options['no_texts']).get()
+        if len(data) == 0:
+            raise CommandError("The Embedding table is empty.")
+
+        header = write_snapshot(options['output'], data)
+        self.stdout.write(
+            f"Wrote snapshot of {header['n_rows']} rows (BERT {header['bert_dim']}d, "
+            f"TF-IDF {header['tfidf_dim']}d, {header['payload_bytes'] / 2 ** 20:.1f} MB) "
+            f"to {options['output']} in {time.perf_counter() - started:.2f}s\n"
+            f"index version {header['index_version']}, sha256 {header['checksum']}"
+        )
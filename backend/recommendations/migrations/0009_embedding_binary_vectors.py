@@ -0,0 +1,54 @@
+# Generated by Django 5.0.6 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0008_alter_metadata_title'),
+    ]
+
+    operations = [
+        # Nullable so 0011 can be reversed on a populated table
+        migrations.AlterField(
+            model_name='embedding',
+            name='tfidf_embedding',
+            field=models.JSONField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='embedding',
+            name='bert_embedding',
+            field=models.JSONField(null=True),
+        ),
+        migrations.AddField(
+            model_name='embedding',
+            name='tfidf_indices',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='embedding',
+            name='tfidf_values',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='embedding',
+            name='tfidf_dim',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='embedding',
+            name='bert_vector',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='embedding',
+            name='bert_dim',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='embedding',
+            name='vector_dtype',
+            field=models.CharField(default='float32', max_length=16),
+        ),
+    ]
@@ -0,0 +1,97 @@
+# Converts the JSON embedding columns to the binary columns added in 0009.
+# Rows are processed in primary-key chunks, each committed on its own, so the
+# migration can be interrupted and re-run on large tables.
+
+import numpy as np
+from django.db import migrations, transaction
+
+CHUNK_SIZE = 500
+
+# Frozen copy of the encoding in recommendations.embedding_codec as of this migration:
+# raw little-endian arrays, int32 TF-IDF column indices
+INDEX_DTYPE = np.dtype('<i4')
+VALUE_DTYPE = np.dtype('<f4')
+
+
+def encode_dense(vector):
+    vector = np.ascontiguousarray(vector, dtype=VALUE_DTYPE).ravel()
+    return vector.tobytes(), vector.shape[0]
+
+
+def decode_dense(data, dtype='float32'):
+    return np.frombuffer(data, dtype=np.dtype(dtype).newbyteorder('<'))
+
+
+def encode_sparse(indices, values):
+    return (np.ascontiguousarray(indices, dtype=INDEX_DTYPE).tobytes(),
+            np.ascontiguousarray(values, dtype=VALUE_DTYPE).tobytes())
+
+
+def decode_sparse(indices_data, values_data, dtype='float32'):
+    return np.frombuffer(indices_data, dtype=INDEX_DTYPE), decode_dense(values_data, dtype)
+
+
+def _tfidf_from_json(tfidf_embedding):
+    if isinstance(tfidf_embedding, dict):
+        return tfidf_embedding['indices'], tfidf_embedding['values'], int(tfidf_embedding['dim'])
+    dense = np.asarray(tfidf_embedding, dtype=np.float32)
+    indices = np.flatnonzero(dense)
+    return indices, dense[indices], dense.shape[0]
+
+
+def json_to_binary(apps, schema_editor):
+    Embedding = apps.get_model('recommendations', 'Embedding')
+    pending = Embedding.objects.filter(bert_vector__isnull=True).order_by('id')
+    last_id = 0
+    while True:
+        chunk = list(
+            pending.filter(id__gt=last_id).only('id', 'tfidf_embedding', 'bert_embedding')[:CHUNK_SIZE]
+        )
+        if not chunk:
+            break
+        for embedding in chunk:
+            indices, values, dim = _tfidf_from_json(embedding.tfidf_embedding)
+            embedding.tfidf_indices, embedding.tfidf_values = encode_sparse(indices, values)
+            embedding.tfidf_dim = dim
+            embedding.bert_vector, embedding.bert_dim = encode_dense(embedding.bert_embedding)
+            embedding.vector_dtype = 'float32'
+        with transaction.atomic():
+            Embedding.objects.bulk_update(
+                chunk,
+                ['tfidf_indices', 'tfidf_values', 'tfidf_dim', 'bert_vector', 'bert_dim', 'vector_dtype'],
+            )
+        last_id = chunk[-1].id
+
+
+def binary_to_json(apps, schema_editor):
+    Embedding = apps.get_model('recommendations', 'Embedding')
+    pending = Embedding.objects.filter(bert_vector__isnull=False).order_by('id')
+    last_id = 0
+    while True:
+        chunk = list(pending.filter(id__gt=last_id)[:CHUNK_SIZE])
+        if not chunk:
+            break
+        for embedding in chunk:
+            indices, values = decode_sparse(embedding.tfidf_indices, embedding.tfidf_values, embedding.vector_dtype)
+            embedding.tfidf_embedding = {
+                'indices': indices.tolist(),
+                'values': values.tolist(),
+                'dim': embedding.tfidf_dim,
+            }
+            embedding.bert_embedding = decode_dense(embedding.bert_vector, embedding.vector_dtype).tolist()
+        with transaction.atomic():
+            Embedding.objects.bulk_update(chunk, ['tfidf_embedding', 'bert_embedding'])
+        last_id = chunk[-1].id
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('recommendations', '0009_embedding_binary_vectors'),
+    ]
+
+    operations = [
+        migrations.RunPython(json_to_binary, binary_to_json),
+    ]
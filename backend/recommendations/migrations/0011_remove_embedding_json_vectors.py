@@ -0,0 +1,46 @@
+# Generated by Django 5.0.6 on 2026-10-18 09:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0010_convert_embeddings_to_binary'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='embedding',
+            name='tfidf_embedding',
+        ),
+        migrations.RemoveField(
+            model_name='embedding',
+            name='bert_embedding',
+        ),
+        migrations.AlterField(
+            model_name='embedding',
+            name='tfidf_indices',
+            field=models.BinaryField(),
+        ),
+        migrations.AlterField(
+            model_name='embedding',
+            name='tfidf_values',
+            field=models.BinaryField(),
+        ),
+        migrations.AlterField(
+            model_name='embedding',
+            name='tfidf_dim',
+            field=models.PositiveIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='embedding',
+            name='bert_vector',
+            field=models.BinaryField(),
+        ),
+        migrations.AlterField(
+            model_name='embedding',
+            name='bert_dim',
+            field=models.PositiveIntegerField(),
+        ),
+    ]
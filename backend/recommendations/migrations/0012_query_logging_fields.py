@@ -0,0 +1,28 @@
+# Generated by Django 5.0.6 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0011_remove_embedding_json_vectors'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='query',
+            name='latency_ms',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='queryresult',
+            name='rank',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='queryresult',
+            name='score',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-18 15:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0012_query_logging_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='embedding',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='embedding',
+            name='encoder_version',
+            field=models.CharField(blank=True, max_length=128, null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Removes duplicate embeddings (keeping the most recently updated one per
+# dataset) so Embedding.dataset can carry a unique constraint, which
+# generate_embeddings.py relies on for bulk upserts.
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def delete_duplicate_embeddings(apps, schema_editor):
+    Embedding = apps.get_model('recommendations', 'Embedding')
+    duplicated = (
+        Embedding.objects.values('dataset_id').annotate(n=Count('id')).filter(n__gt=1)
+        .values_list('dataset_id', flat=True)
+    )
+    for dataset_id in list(duplicated):
+        embeddings = Embedding.objects.filter(dataset_id=dataset_id)
+        keep_id = embeddings.order_by('-updated_at', '-id').values_list('id', flat=True).first()
+        embeddings.exclude(id=keep_id).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0013_embedding_content_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_embeddings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='embedding',
+            constraint=models.UniqueConstraint(fields=('dataset',), name='unique_embedding_per_dataset'),
+        ),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 5.0.6 on 2026-10-18 17:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+CHUNK_SIZE = 500
+INLINE_FIELDS = ['tfidf_indices', 'tfidf_values', 'tfidf_dim', 'bert_vector', 'bert_dim', 'vector_dtype']
+
+
+def copy_vectors_inline(apps, schema_editor):
+    """
+    Reverse step: copy each embedding's shared vector back into its own
+    columns, which 0014 requires to be filled.
+    """
+    Embedding = apps.get_model('recommendations', 'Embedding')
+    pending = Embedding.objects.filter(vector__isnull=False, bert_vector__isnull=True).order_by('id')
+    last_id = 0
+    while True:
+        chunk = list(pending.filter(id__gt=last_id).select_related('vector')[:CHUNK_SIZE])
+        if not chunk:
+            break
+        for embedding in chunk:
+            for field in INLINE_FIELDS:
+                setattr(embedding, field, getattr(embedding.vector, field))
+        Embedding.objects.bulk_update(chunk, INLINE_FIELDS)
+        last_id = chunk[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0014_embedding_unique_dataset'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='embedding',
+            name='bert_dim',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='embedding',
+            name='bert_vector',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='embedding',
+            name='tfidf_dim',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='embedding',
+            name='tfidf_indices',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='embedding',
+            name='tfidf_values',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.CreateModel(
+            name='EmbeddingVector',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64)),
+                ('encoder_version', models.CharField(max_length=128)),
+                ('tfidf_indices', models.BinaryField()),
+                ('tfidf_values', models.BinaryField()),
+                ('tfidf_dim', models.PositiveIntegerField()),
+                ('bert_vector', models.BinaryField()),
+                ('bert_dim', models.PositiveIntegerField()),
+                ('vector_dtype', models.CharField(default='float32', max_length=16)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('content_hash', 'encoder_version'), name='unique_vector_per_content')],
+            },
+        ),
+        migrations.AddField(
+            model_name='embedding',
+            name='vector',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='embeddings', to='recommendations.embeddingvector'),
+        ),
+        # Last, so on reversal it runs first, while the vectors and the nullable columns still exist
+        migrations.RunPython(migrations.RunPython.noop, copy_vectors_inline),
+    ]
@@ -1,5 +1,4 @@
 from django.db import models
-from django.db.models import JSONField
 
 class Metadata(models.Model):
     title = models.CharField(max_length=255)
@@ -14,19 +13,60 @@ class Metadata(models.Model):
     def __str__(self):
         return self.title
 
+class EmbeddingVector(models.Model):
+    # Content-addressed vector store: one row per distinct normalized combined text and encoder
+    # version, shared by every Embedding whose dataset has that text (mirrors, forks)
+    content_hash = models.CharField(max_length=64)
+    encoder_version = models.CharField(max_length=128)
+    # Raw little-endian vectors, see recommendations.embedding_codec
+    tfidf_indices = models.BinaryField()
+    tfidf_values = models.BinaryField()
+    tfidf_dim = models.PositiveIntegerField()
+    bert_vector = models.BinaryField()
+    bert_dim = models.PositiveIntegerField()
+    vector_dtype = models.CharField(max_length=16, default='float32')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['content_hash', 'encoder_version'], name='unique_vector_per_content'),
+        ]
+
+    def __str__(self):
+        return f"Vector {self.content_hash[:12]} ({self.encoder_version})"
+
 class Embedding(models.Model):
     dataset = models.ForeignKey(Metadata, on_delete=models.CASCADE, related_name='embeddings')
-    tfidf_embedding = JSONField()
-    bert_embedding = JSONField()
+    # Shared vectors written by generate_embeddings.py; when set, the inline vector columns are empty
+    vector = models.ForeignKey(EmbeddingVector, on_delete=models.PROTECT, null=True, blank=True,
+                               related_name='embeddings')
+    # Raw little-endian vectors, see recommendations.embedding_codec
+    tfidf_indices = models.BinaryField(null=True)  # int32 column ids of the non-zero TF-IDF weights
+    tfidf_values = models.BinaryField(null=True)
+    tfidf_dim = models.PositiveIntegerField(null=True)
+    bert_vector = models.BinaryField(null=True)
+    bert_dim = models.PositiveIntegerField(null=True)
+    vector_dtype = models.CharField(max_length=16, default='float32')
     combined_normalized_text = models.TextField(null=True, blank=True) 
+    # SHA-256 of the normalized title + description, and the encoders it was embedded with;
+    # generate_embeddings.py only re-encodes rows where either changed
+    content_hash = models.CharField(max_length=64, null=True, blank=True)
+    encoder_version = models.CharField(max_length=128, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        constraints = [
+            # One embedding per dataset; generate_embeddings.py upserts on this
+            models.UniqueConstraint(fields=['dataset'], name='unique_embedding_per_dataset'),
+        ]
+
     def __str__(self):
         return f"Embedding for {self.dataset.title}"
 
 class Query(models.Model):
     query_text = models.TextField()
+    latency_ms = models.FloatField(null=True, blank=True)  # Time spent ranking, as logged by the search path
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     results = models.ManyToManyField(Metadata, through='QueryResult')
@@ -36,4 +76,6 @@ class Query(models.Model):
 
 class QueryResult(models.Model):
     query = models.ForeignKey(Query, on_delete=models.CASCADE)
-    dataset = models.ForeignKey(Metadata, on_delete=models.CASCADE)
\ No newline at end of file
+    dataset = models.ForeignKey(Metadata, on_delete=models.CASCADE)
+    rank = models.PositiveIntegerField(null=True, blank=True)  # 1-based position in the ranked results
+    score = models.FloatField(null=True, blank=True)
\ No newline at end of file
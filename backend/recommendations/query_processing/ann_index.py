@@ -0,0 +1,255 @@
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_rows(vectors):
+    """Return an L2-normalized float32 copy of ``vectors`` (zero rows stay zero)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def nearest_centroids(vectors, centroids, chunk_size=8192):
+    """Return the index of the most similar centroid for every row of ``vectors``."""
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk_size):
+        chunk = vectors[start:start + chunk_size]
+        assignments[start:start + chunk_size] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignments
+
+
+def spherical_kmeans(vectors, n_clusters, n_iter=20, seed=0):
+    """
+    Cluster L2-normalized ``vectors`` by cosine similarity.
+
+    Returns ``(centroids, assignments)``. Empty clusters are re-seeded with
+    random points so every centroid stays usable.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    assignments = np.zeros(len(vectors), dtype=np.int64)
+
+    for _ in range(n_iter):
+        assignments = nearest_centroids(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        counts = np.bincount(assignments, minlength=n_clusters)
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        centroids = normalize_rows(sums)
+
+    return centroids, assignments
+
+
+class IVFIndex:
+    """
+    Inverted-file (IVF) approximate nearest-neighbour index for BERT vectors.
+
+    Vectors are clustered with spherical k-means; each cluster ("list") keeps
+    the dataset ids assigned to it. A query scores the centroids, probes the
+    ``nprobe`` closest lists and only compares against their members. Larger
+    ``nprobe`` trades latency for recall.
+    """
+
+    def __init__(self, centroids, list_offsets, list_dataset_ids):
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_dataset_ids = list_dataset_ids
+        self._bound = None
+
+    @property
+    def n_lists(self):
+        return self.centroids.shape[0]
+
+    @classmethod
+    def build(cls, vectors, dataset_ids, n_lists=None, n_iter=20, seed=0):
+        """Train centroids on ``vectors`` and assign every dataset id to a list."""
+        vectors = normalize_rows(vectors)
+        dataset_ids = np.asarray(dataset_ids, dtype=np.int64)
+        if not n_lists:
+            n_lists = int(4 * np.sqrt(len(vectors)))
+        n_lists = max(1, min(n_lists, len(vectors)))
+
+        # Train on a bounded sample, then assign the full corpus
+        rng = np.random.default_rng(seed)
+        sample_size = min(len(vectors), 256 * n_lists)
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        centroids, _ = spherical_kmeans(sample, n_lists, n_iter=n_iter, seed=seed)
+
+        assignments = nearest_centroids(vectors, centroids)
+        order = np.argsort(assignments, kind='stable')
+        list_offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        list_offsets[1:] = np.cumsum(np.bincount(assignments, minlength=n_lists))
+        return cls(centroids, list_offsets, dataset_ids[order])
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            np.savez(
+                f,
+                centroids=self.centroids,
+                list_offsets=self.list_offsets,
+                list_dataset_ids=self.list_dataset_ids,
+            )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['centroids'], data['list_offsets'], data['list_dataset_ids'])
+
+    def _bind(self, dataset_ids):
+        """
+        Map the stored dataset ids onto rows of the current embedding index.
+
+        Rows whose dataset was embedded after the index was built are returned
+        as ``extra_rows`` and always searched, so fresh data is never missed.
+        """
+        bound = self._bound
+        if bound is not None and bound[0] is dataset_ids:
+            return bound[1], bound[2]
+
+        # dataset_ids is sorted (the embedding index orders rows by dataset id)
+        if len(dataset_ids):
+            positions = np.searchsorted(dataset_ids, self.list_dataset_ids)
+            positions = np.minimum(positions, len(dataset_ids) - 1)
+            found = dataset_ids[positions] == self.list_dataset_ids
+        else:
+            positions = np.zeros(len(self.list_dataset_ids), dtype=np.int64)
+            found = np.zeros(len(self.list_dataset_ids), dtype=bool)
+        list_rows = np.where(found, positions, -1)
+
+        indexed = np.zeros(len(dataset_ids), dtype=bool)
+        indexed[list_rows[found]] = True
+        extra_rows = np.flatnonzero(~indexed)
+
+        self._bound = (dataset_ids, list_rows, extra_rows)
+        return list_rows, extra_rows
+
+    def candidate_rows(self, query_vector, dataset_ids, nprobe, allowed=None, min_candidates=0):
+        """
+        Return the embedding index rows to score exactly for ``query_vector``.
+
+        Args:
+            query_vector (numpy.ndarray): 1-D query embedding.
+            dataset_ids (numpy.ndarray): Sorted dataset ids of the embedding index rows.
+            nprobe (int): Number of closest lists to probe.
+            allowed (numpy.ndarray): Sorted rows passing the query filters, or ``None``.
+            min_candidates (int): With ``allowed``, keep probing lists beyond
+                ``nprobe`` until this many allowed rows are found, so a
+                selective filter does not empty the candidate set.
+
+        Returns:
+            numpy.ndarray: Unique row indices.
+        """
+        list_rows, extra_rows = self._bind(dataset_ids)
+        query_vector = normalize_rows(query_vector.reshape(1, -1))[0]
+        nprobe = max(1, min(nprobe, self.n_lists))
+        centroid_scores = self.centroids @ query_vector
+
+        if allowed is None:
+            if nprobe < self.n_lists:
+                probed = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+            else:
+                probed = np.arange(self.n_lists)
+            parts = [list_rows[self.list_offsets[i]:self.list_offsets[i + 1]] for i in probed]
+            parts.append(extra_rows)
+            rows = np.concatenate(parts)
+            return rows[rows >= 0]
+
+        def allowed_only(rows):
+            rows = rows[rows >= 0]
+            if not len(allowed):
+                return rows[:0]
+            positions = np.minimum(np.searchsorted(allowed, rows), len(allowed) - 1)
+            return rows[allowed[positions] == rows]
+
+        parts = [allowed_only(extra_rows)]
+        found = len(parts[0])
+        for rank, i in enumerate(np.argsort(-centroid_scores, kind='stable')):
+            if rank >= nprobe and found >= min_candidates:
+                break
+            parts.append(allowed_only(list_rows[self.list_offsets[i]:self.list_offsets[i + 1]]))
+            found += len(parts[-1])
+        return np.concatenate(parts)
+
+
+_lock = threading.Lock()
+_loaded = (None, None, None)  # (path, mtime, index)
+
+
+def get_ann_index():
+    """
+    Return the IVF index configured by ``BERT_ANN_INDEX_PATH``, or ``None``.
+
+    The file is loaded once and reloaded when it is rewritten on disk.
+    """
+    global _loaded
+    path = str(settings.BERT_ANN_INDEX_PATH)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+    loaded = _loaded
+    if loaded[:2] == (path, mtime):
+        return loaded[2]
+    with _lock:
+        if _loaded[:2] != (path, mtime):
+            started = time.perf_counter()
+            _loaded = (path, mtime, IVFIndex.load(path))
+            logger.info(f"Loaded IVF index from {path} in {time.perf_counter() - started:.2f}s")
+        return _loaded[2]
+
+
+def evaluate_recall(ann, vectors, dataset_ids, k=10, nprobes=(1, 2, 4, 8, 16), n_queries=200, seed=0):
+    """
+    Compare IVF search against exact cosine search on sampled corpus vectors.
+
+    Each sampled row is used as a query with itself excluded from both result
+    lists. Returns the exact-search latency and, per ``nprobe``, recall@k,
+    latency and the fraction of rows scored.
+    """
+    vectors = normalize_rows(vectors)
+    rng = np.random.default_rng(seed)
+    query_rows = rng.choice(len(vectors), min(n_queries, len(vectors)), replace=False)
+
+    def top_k(scores, rows, exclude):
+        keep = rows != exclude
+        scores, rows = scores[keep], rows[keep]
+        if len(rows) > k:
+            best = np.argpartition(-scores, k - 1)[:k]
+            scores, rows = scores[best], rows[best]
+        return rows
+
+    all_rows = np.arange(len(vectors))
+    exact = {}
+    started = time.perf_counter()
+    for row in query_rows:
+        exact[row] = set(top_k(vectors @ vectors[row], all_rows, row).tolist())
+    exact_ms = (time.perf_counter() - started) * 1000 / len(query_rows)
+
+    report = []
+    for nprobe in nprobes:
+        hits = scanned = 0
+        started = time.perf_counter()
+        for row in query_rows:
+            rows = ann.candidate_rows(vectors[row], dataset_ids, nprobe)
+            found = top_k(vectors[rows] @ vectors[row], rows, row)
+            hits += len(exact[row].intersection(found.tolist()))
+            scanned += len(rows)
+        elapsed_ms = (time.perf_counter() - started) * 1000 / len(query_rows)
+        report.append({
+            'nprobe': nprobe,
+            'recall': hits / sum(len(rows) for rows in exact.values()),
+            'latency_ms': elapsed_ms,
+            'scanned': scanned / (len(query_rows) * len(vectors)),
+        })
+    return exact_ms, report
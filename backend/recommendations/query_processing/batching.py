@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class EncodeBatcher:
+    """
+    Coalesce concurrent single-text encode requests into batched forward passes.
+
+    Callers ``submit`` a text and get a ``Future``. A dedicated worker thread
+    takes the first waiting text, keeps collecting for up to ``window_ms`` or
+    until ``max_batch`` texts are queued, encodes them in one call and
+    resolves each future with its own ``(1, d)`` row.
+    """
+
+    def __init__(self, encode, window_ms=3.0, max_batch=32):
+        self._encode = encode
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        self.batches = 0
+        self.texts = 0
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            with self._lock:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(target=self._run, name='encode-batcher', daemon=True)
+                    self._worker.start()
+
+    def submit(self, text):
+        """Queue ``text`` for encoding and return a ``Future`` of its embedding."""
+        future = Future()
+        self._ensure_worker()
+        self._queue.put((text, future))
+        return future
+
+    def encode(self, text, timeout=None):
+        """Encode ``text`` through the batcher, blocking the calling thread."""
+        return self.submit(text).result(timeout=timeout)
+
+    async def aencode(self, text):
+        """Encode ``text`` through the batcher without blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(text))
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            pending = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+            if not pending:
+                continue
+
+            # Identical texts in one window share a single row
+            texts = list(dict.fromkeys(text for text, _ in pending))
+            try:
+                embeddings = np.asarray(self._encode(texts))
+            except Exception as e:
+                logger.error(f"Batched encode of {len(texts)} texts failed: {e}")
+                for _, future in pending:
+                    future.set_exception(e)
+                continue
+
+            rows = {text: i for i, text in enumerate(texts)}
+            for text, future in pending:
+                i = rows[text]
+                future.set_result(embeddings[i:i + 1].copy())
+            self.batches += 1
+            self.texts += len(texts)
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'texts': self.texts,
+            'mean_batch_size': self.texts / self.batches if self.batches else 0.0,
+            'queued': self._queue.qsize(),
+        }
+
+
+_lock = threading.Lock()
+_batcher = None
+
+
+def get_encode_batcher():
+    """Return the process-wide BERT encode batcher configured by ``QUERY_BATCHING_*``."""
+    global _batcher
+    if _batcher is None:
+        with _lock:
+            if _batcher is None:
+                from recommendations.query_processing.encoders import get_bert_model
+
+                _batcher = EncodeBatcher(
+                    lambda texts: get_bert_model()[0].encode(texts),
+                    window_ms=settings.QUERY_BATCHING_WINDOW_MS,
+                    max_batch=settings.QUERY_BATCHING_MAX_BATCH,
+                )
+    return _batcher
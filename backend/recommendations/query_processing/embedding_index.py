@@ -0,0 +1,340 @@
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Count, Max
+from django.db.models.functions import Coalesce
+
+from recommendations.embedding_codec import decode_dense, decode_sparse
+from recommendations.query_processing.quantization import quantize
+from recommendations.query_processing.snapshot import SnapshotError, open_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Metadata fields returned with every query result (format, source and size also back the filters)
+METADATA_FIELDS = ('id', 'title', 'description', 'url', 'size', 'format', 'source')
+
+# Embedding vector columns, stored inline or on the shared EmbeddingVector the row references
+VECTOR_FIELDS = ('tfidf_indices', 'tfidf_values', 'tfidf_dim', 'bert_vector', 'bert_dim', 'vector_dtype')
+
+
+def with_stored_vectors(embeddings):
+    """Annotate ``stored_<field>`` for every vector column, read from ``Embedding.vector`` when set."""
+    return embeddings.annotate(**{
+        f'stored_{field}': Coalesce(f'vector__{field}', field) for field in VECTOR_FIELDS
+    })
+
+
+def build_csr_matrix(sparse_rows, dim):
+    """Stack ``(indices, values)`` pairs into a float32 CSR matrix with ``dim`` columns."""
+    from scipy import sparse
+
+    indptr = np.zeros(len(sparse_rows) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(row[0]) for row in sparse_rows])
+    if sparse_rows:
+        indices = np.concatenate([row[0] for row in sparse_rows])
+        values = np.concatenate([row[1] for row in sparse_rows]).astype(np.float32, copy=False)
+    else:
+        indices = np.empty(0, dtype=np.int32)
+        values = np.empty(0, dtype=np.float32)
+    return sparse.csr_matrix((values, indices, indptr), shape=(len(sparse_rows), dim))
+
+
+def stack_dense_rows(dense_rows, dim):
+    """Stack 1-D vectors into a contiguous float32 ``(len(dense_rows), dim)`` matrix."""
+    if not dense_rows:
+        return np.empty((0, dim), dtype=np.float32)
+    return np.ascontiguousarray(np.vstack(dense_rows), dtype=np.float32)
+
+
+def normalize_dense_rows(matrix):
+    """L2-normalize the rows of a float32 matrix in place and return their original norms."""
+    norms = np.linalg.norm(matrix, axis=1)
+    np.divide(matrix, norms[:, np.newaxis], out=matrix, where=norms[:, np.newaxis] > 0)
+    return norms
+
+
+def normalize_sparse_rows(matrix):
+    """L2-normalize the rows of a CSR matrix in place and return their original norms."""
+    row_of_value = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    norms = np.sqrt(np.bincount(row_of_value, weights=matrix.data ** 2, minlength=matrix.shape[0]))
+    norms = norms.astype(np.float32)
+    matrix.data /= np.where(norms > 0, norms, 1.0)[row_of_value]
+    return norms
+
+
+def load_bert_rows(dataset_ids, dim):
+    """
+    Read the full-precision, L2-normalized BERT vectors of ``dataset_ids`` from the database.
+
+    Used to re-rank candidates when the resident matrix is quantized. Returns
+    ``(matrix, found)`` with rows in the order of ``dataset_ids``; datasets
+    deleted since the index was loaded have ``found`` false and a zero row.
+    """
+    from recommendations.models import Embedding
+
+    rows = with_stored_vectors(Embedding.objects.filter(dataset_id__in=list(dataset_ids))).values_list(
+        'dataset_id', 'stored_bert_vector', 'stored_vector_dtype')
+    vectors = {dataset_id: decode_dense(bert_vector, vector_dtype) for dataset_id, bert_vector, vector_dtype in rows}
+    matrix = np.zeros((len(dataset_ids), dim), dtype=np.float32)
+    found = np.zeros(len(dataset_ids), dtype=bool)
+    for i, dataset_id in enumerate(dataset_ids):
+        vector = vectors.get(dataset_id)
+        if vector is not None and len(vector) == dim:
+            matrix[i] = vector
+            found[i] = True
+    normalize_dense_rows(matrix)
+    return matrix, found
+
+
+class IndexData:
+    """
+    Immutable snapshot of the Embedding table used for scoring.
+
+    Row ``i`` of ``tfidf_matrix`` (sparse CSR) and ``bert_matrix`` belongs to
+    ``dataset_ids[i]``; ``metadata[i]`` holds that dataset's result fields, or
+    ``None`` if its Metadata row is missing.
+
+    Both matrices are L2-normalized, so cosine similarity is a plain dot
+    product; the original row norms are kept in ``tfidf_norms``/``bert_norms``.
+    ``tfidf_matrix_t`` is the term-major (vocabulary x rows) CSR transpose, so
+    a query x corpus product only reads the rows of the query's terms.
+
+    ``bert_matrix`` is a float32 array, or a compressed matrix from
+    ``quantization.quantize()`` when ``BERT_QUANTIZATION`` is set.
+    ``full_bert_matrix`` is the memory-mapped float32 matrix of a snapshot,
+    used to re-rank quantized scores without a database read.
+    """
+
+    def __init__(self, dataset_ids, tfidf_matrix, bert_matrix, metadata, watermark, texts=None,
+                 tfidf_norms=None, bert_norms=None, tfidf_matrix_t=None):
+        self.dataset_ids = dataset_ids
+        self.tfidf_matrix = tfidf_matrix
+        self.tfidf_matrix_t = tfidf_matrix.T.tocsr() if tfidf_matrix_t is None else tfidf_matrix_t
+        self.bert_matrix = bert_matrix
+        self.full_bert_matrix = None
+        self.tfidf_norms = tfidf_norms
+        self.bert_norms = bert_norms
+        self.metadata = metadata
+        self.watermark = watermark
+        # combined_normalized_text per row, only loaded for BM25 scoring
+        self.texts = texts
+        # Built on demand by lexical_index.get_lexical_index() and filters.get_filter_index()
+        self.lexical_index = None
+        self.filter_index = None
+
+    def __len__(self):
+        return len(self.dataset_ids)
+
+
+class EmbeddingIndex:
+    """
+    Process-wide, in-memory copy of all embeddings and the Metadata fields
+    returned with each result.
+
+    The data is loaded once and reused by every query. The index is dropped
+    when ``invalidate()`` is called (Embedding/Metadata save/delete signals)
+    and is reloaded when the tables' ``updated_at``/row count watermark moves,
+    which also catches writes made by other processes such as
+    ``generate_embeddings.py``.
+
+    With ``EMBEDDING_INDEX_SOURCE = 'snapshot'`` the data is instead mapped
+    from the file written by ``manage.py write_embedding_snapshot`` and
+    remapped whenever that file is replaced; the database is not read.
+    """
+
+    def __init__(self, refresh_interval=None, quantization=None, source=None, load_texts=None):
+        self._lock = threading.Lock()
+        self._data = None
+        self._last_check = 0.0
+        self._refresh_interval = refresh_interval
+        self._quantization = quantization
+        self._source = source
+        self._load_texts = load_texts
+
+    @property
+    def refresh_interval(self):
+        if self._refresh_interval is not None:
+            return self._refresh_interval
+        return getattr(settings, 'EMBEDDING_INDEX_REFRESH_SECONDS', 30)
+
+    @property
+    def quantization(self):
+        if self._quantization is not None:
+            return self._quantization
+        return getattr(settings, 'BERT_QUANTIZATION', 'none')
+
+    @property
+    def source(self):
+        if self._source is not None:
+            return self._source
+        return getattr(settings, 'EMBEDDING_INDEX_SOURCE', 'database')
+
+    @property
+    def load_texts(self):
+        # combined_normalized_text is only needed for BM25 scoring
+        if self._load_texts is not None:
+            return self._load_texts
+        return settings.LEXICAL_BACKEND == 'bm25'
+
+    @property
+    def is_loaded(self):
+        return self._data is not None
+
+    def invalidate(self):
+        """Drop the loaded matrices so the next ``get()`` reloads them."""
+        self._data = None
+
+    def reset_lock(self):
+        """Replace the lock in a forked child, where a reload the parent was running never releases it."""
+        self._lock = threading.Lock()
+
+    def _is_fresh(self, data):
+        return data is not None and time.monotonic() - self._last_check < self.refresh_interval
+
+    def get(self):
+        """Return the current ``IndexData``, loading or refreshing it if needed."""
+        data = self._data
+        if self._is_fresh(data):
+            return data
+
+        with self._lock:
+            data = self._data
+            if self._is_fresh(data):
+                return data
+            return self._refresh(self._fetch_watermark())
+
+    async def aget(self):
+        """
+        Async variant of ``get()`` for ASGI views.
+
+        The watermark is read with the async ORM; a reload, which is CPU bound,
+        runs on a worker thread so the event loop is never blocked.
+        """
+        data = self._data
+        if self._is_fresh(data):
+            return data
+
+        watermark = await self._afetch_watermark()
+        if data is not None and data.watermark == watermark:
+            self._last_check = time.monotonic()
+            return data
+        return await sync_to_async(self._locked_refresh, thread_sensitive=False)(watermark)
+
+    def _locked_refresh(self, watermark):
+        with self._lock:
+            return self._refresh(watermark)
+
+    def _refresh(self, watermark):
+        # Caller holds self._lock
+        data = self._data
+        if data is None or data.watermark != watermark:
+            data = self._load(watermark)
+            self._data = data
+        self._last_check = time.monotonic()
+        return data
+
+    def _snapshot_watermark(self):
+        path = str(settings.EMBEDDING_SNAPSHOT_PATH)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            raise SnapshotError(f"No embedding index snapshot at {path}; "
+                                f"run `manage.py write_embedding_snapshot`.") from None
+        return ('snapshot', path, stat.st_mtime_ns, stat.st_size)
+
+    def _fetch_watermark(self):
+        from recommendations.models import Embedding, Metadata
+
+        if self.source == 'snapshot':
+            return self._snapshot_watermark()
+        embeddings = Embedding.objects.aggregate(count=Count('id'), latest=Max('updated_at'))
+        metadata = Metadata.objects.aggregate(count=Count('id'), latest=Max('updated_at'))
+        return (embeddings['count'], embeddings['latest'], metadata['count'], metadata['latest'])
+
+    async def _afetch_watermark(self):
+        from recommendations.models import Embedding, Metadata
+
+        if self.source == 'snapshot':
+            return self._snapshot_watermark()
+        embeddings = await Embedding.objects.aaggregate(count=Count('id'), latest=Max('updated_at'))
+        metadata = await Metadata.objects.aaggregate(count=Count('id'), latest=Max('updated_at'))
+        return (embeddings['count'], embeddings['latest'], metadata['count'], metadata['latest'])
+
+    def _load(self, watermark):
+        if self.source == 'snapshot':
+            return self._load_snapshot(watermark)
+        return self._load_database(watermark)
+
+    def _load_snapshot(self, watermark):
+        try:
+            data = open_snapshot(watermark[1], watermark, load_texts=self.load_texts,
+                                 verify=settings.EMBEDDING_SNAPSHOT_VERIFY)
+        except SnapshotError as e:
+            # Serve from the database until a usable snapshot replaces this one
+            logger.warning(f"{e} Loading the embedding index from the database instead.")
+            return self._load_database(watermark)
+        if self.quantization != 'none':
+            # The compressed copy is private; re-ranking reads the shared mapping
+            data.full_bert_matrix = data.bert_matrix
+            data.bert_matrix = quantize(data.bert_matrix, self.quantization,
+                                        pq_subvectors=settings.BERT_PQ_SUBVECTORS,
+                                        pq_codewords=settings.BERT_PQ_CODEWORDS)
+        return data
+
+    def _load_database(self, watermark):
+        from recommendations.models import Embedding, Metadata
+
+        started = time.perf_counter()
+        load_texts = self.load_texts
+        rows = with_stored_vectors(Embedding.objects.order_by('dataset_id')).values_list(
+            'dataset_id', 'stored_tfidf_indices', 'stored_tfidf_values', 'stored_tfidf_dim',
+            'stored_bert_vector', 'stored_bert_dim', 'stored_vector_dtype',
+            'combined_normalized_text' if load_texts else 'dataset_id',
+        )
+
+        dataset_ids, tfidf_rows, bert_rows, texts = [], [], [], []
+        tfidf_dim = bert_dim = 0
+        for (dataset_id, tfidf_indices, tfidf_values, row_tfidf_dim,
+                bert_vector, row_bert_dim, vector_dtype, text) in rows.iterator(chunk_size=2000):
+            dataset_ids.append(dataset_id)
+            if load_texts:
+                texts.append(text)
+            tfidf_rows.append(decode_sparse(tfidf_indices, tfidf_values, vector_dtype))
+            bert_rows.append(decode_dense(bert_vector, vector_dtype))
+            tfidf_dim = max(tfidf_dim, row_tfidf_dim)
+            bert_dim = max(bert_dim, row_bert_dim)
+
+        dataset_ids = np.asarray(dataset_ids, dtype=np.int64)
+        tfidf_matrix = build_csr_matrix(tfidf_rows, tfidf_dim)
+        bert_matrix = stack_dense_rows(bert_rows, bert_dim)
+        # Normalize once here instead of on every query
+        tfidf_norms = normalize_sparse_rows(tfidf_matrix)
+        bert_norms = normalize_dense_rows(bert_matrix)
+        bert_matrix = quantize(bert_matrix, self.quantization,
+                               pq_subvectors=settings.BERT_PQ_SUBVECTORS,
+                               pq_codewords=settings.BERT_PQ_CODEWORDS)
+
+        # Project the result fields once so query results need no further queries
+        projection = {
+            row['id']: row
+            for row in Metadata.objects.values(*METADATA_FIELDS).iterator(chunk_size=2000)
+        }
+        metadata = [projection.get(dataset_id) for dataset_id in dataset_ids.tolist()]
+
+        logger.info(
+            f"Loaded embedding index with {len(dataset_ids)} rows "
+            f"in {time.perf_counter() - started:.2f}s"
+        )
+        return IndexData(dataset_ids, tfidf_matrix, bert_matrix, metadata, watermark,
+                         texts=texts if load_texts else None,
+                         tfidf_norms=tfidf_norms, bert_norms=bert_norms)
+
+
+# Shared by every request handled in this process
+embedding_index = EmbeddingIndex()
+os.register_at_fork(after_in_child=embedding_index.reset_lock)
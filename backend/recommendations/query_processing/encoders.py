@@ -0,0 +1,93 @@
+import logging
+import os
+import threading
+import time
+
+import joblib
+from django.conf import settings
+
+from recommendations.query_processing.query_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_tfidf = (None, None)  # (vectorizer, version)
+_bert = (None, None)  # (model, version)
+
+
+def _reset_lock_after_fork():
+    # A load running on another thread at fork time would leave _lock held forever in the child
+    global _lock
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_lock_after_fork)
+
+# Query embeddings keyed by (kind, encoder version, normalized query text)
+query_embedding_cache = LRUCache(
+    settings.QUERY_EMBEDDING_CACHE_SIZE,
+    ttl=settings.QUERY_EMBEDDING_CACHE_TTL,
+)
+
+
+def _file_version(path):
+    """Identify a file or directory by path, size and modification time."""
+    stat = os.stat(path)
+    return f"{path}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def _bert_version():
+    name = settings.BERT_MODEL_NAME
+    # Local model directories are versioned by their modification time
+    return _file_version(name) if os.path.exists(name) else name
+
+
+def get_tfidf_vectorizer():
+    """
+    Return ``(vectorizer, version)`` for ``TFIDF_VECTORIZER_PATH``.
+
+    The pickle is reloaded, and cached query embeddings dropped, whenever the
+    file changes on disk.
+    """
+    global _tfidf
+    version = _file_version(settings.TFIDF_VECTORIZER_PATH)
+    vectorizer, loaded_version = _tfidf
+    if loaded_version == version:
+        return vectorizer, version
+    with _lock:
+        if _tfidf[1] != version:
+            started = time.perf_counter()
+            _tfidf = (joblib.load(settings.TFIDF_VECTORIZER_PATH), version)
+            query_embedding_cache.clear()
+            logger.info(f"Loaded TF-IDF vectorizer in {time.perf_counter() - started:.2f}s")
+        return _tfidf
+
+
+def get_bert_model():
+    """
+    Return ``(model, version)`` for ``BERT_MODEL_NAME``.
+
+    A local model directory is reloaded, and cached query embeddings dropped,
+    when it changes on disk.
+    """
+    global _bert
+    version = _bert_version()
+    model, loaded_version = _bert
+    if loaded_version == version:
+        return model, version
+    with _lock:
+        if _bert[1] != version:
+            # Imported here: sentence_transformers pulls in torch, which dominates startup time
+            from sentence_transformers import SentenceTransformer
+
+            started = time.perf_counter()
+            _bert = (SentenceTransformer(settings.BERT_MODEL_NAME), version)
+            query_embedding_cache.clear()
+            logger.info(f"Loaded SentenceTransformer '{settings.BERT_MODEL_NAME}' "
+                        f"in {time.perf_counter() - started:.2f}s")
+        return _bert
+
+
+def encoders_loaded():
+    """Report which query encoders are loaded in this process."""
+    return {'tfidf_vectorizer': _tfidf[0] is not None, 'bert_model': _bert[0] is not None}
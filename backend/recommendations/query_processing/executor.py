@@ -0,0 +1,53 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+
+
+class QueryPoolFull(Exception):
+    """Raised when every worker is busy and the wait queue is at ``QUERY_ASYNC_MAX_QUEUE``."""
+
+
+_lock = threading.Lock()
+_executor = None
+_slots = None
+
+
+def get_query_executor():
+    """
+    Return the bounded thread pool that runs encoding and scoring for async views.
+
+    NumPy, scikit-learn and torch release the GIL in their heavy kernels, so a
+    few threads keep the CPU busy while the event loop keeps accepting requests.
+    """
+    global _executor, _slots
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                workers = settings.QUERY_ASYNC_MAX_WORKERS
+                _slots = threading.BoundedSemaphore(workers + settings.QUERY_ASYNC_MAX_QUEUE)
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='query')
+    return _executor
+
+
+async def run_in_query_pool(func, *args, **kwargs):
+    """
+    Run ``func(*args, **kwargs)`` on the query pool and await its result.
+
+    Raises ``QueryPoolFull`` instead of queueing without bound, so overload
+    turns into fast rejections rather than growing latency for everyone. A
+    slot is held until the work really finishes, even if the awaiting request
+    is cancelled.
+    """
+    executor = get_query_executor()
+    if not _slots.acquire(blocking=False):
+        raise QueryPoolFull()
+    try:
+        future = executor.submit(partial(func, *args, **kwargs))
+    except BaseException:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    return await asyncio.wrap_future(future)
@@ -0,0 +1,144 @@
+import re
+import threading
+from collections import defaultdict
+
+import numpy as np
+
+FILTER_FIELDS = ('format', 'source', 'size')
+
+# Upper bounds (exclusive, bytes) of the size buckets; sizes that cannot be parsed are 'unknown'
+SIZE_BUCKETS = (
+    ('small', 10 * 1000 ** 2),
+    ('medium', 1000 ** 3),
+    ('large', None),
+)
+SIZE_BUCKET_NAMES = tuple(name for name, _ in SIZE_BUCKETS) + ('unknown',)
+
+_SIZE_PATTERN = re.compile(r'^\s*([\d.,]+)\s*([kmgtp]?)(i?)b?(?:ytes?)?\s*$', re.IGNORECASE)
+_SIZE_UNITS = {'': 0, 'k': 1, 'm': 2, 'g': 3, 't': 4, 'p': 5}
+
+
+def parse_size(text):
+    """Parse ``Metadata.size`` ("200 kB", "10MB", "3 GiB", "12345") into bytes, or ``None``."""
+    match = _SIZE_PATTERN.match(str(text or ''))
+    if not match:
+        return None
+    number, unit, binary = match.groups()
+    try:
+        value = float(number.replace(',', ''))
+    except ValueError:
+        return None
+    return value * (1024 if binary else 1000) ** _SIZE_UNITS[unit.lower()]
+
+
+def size_bucket(text):
+    size = parse_size(text)
+    if size is None:
+        return 'unknown'
+    for name, upper in SIZE_BUCKETS:
+        if upper is None or size < upper:
+            return name
+
+
+def normalize_value(value):
+    return str(value or '').strip().lower()
+
+
+def format_values(text):
+    """Split ``Metadata.format`` ("json, csv") into normalized formats."""
+    return {normalize_value(value).lstrip('.') for value in str(text or '').split(',') if value.strip()}
+
+
+def parse_filters(raw):
+    """
+    Validate the ``filters`` object of a query request.
+
+    Each of ``format``, ``source`` and ``size`` takes a string or a list of
+    strings; a row must match one of the values of every field given.
+    Returns ``(filters, error)`` with the values normalized and sorted, so
+    equal filters produce equal result cache keys.
+    """
+    if raw is None:
+        return {}, None
+    if not isinstance(raw, dict):
+        return None, "filters must be an object"
+    filters = {}
+    for field, values in raw.items():
+        if field not in FILTER_FIELDS:
+            return None, f"Unknown filter '{field}'; expected one of {', '.join(FILTER_FIELDS)}"
+        if isinstance(values, str):
+            values = [values]
+        if not isinstance(values, list) or not values or not all(isinstance(value, str) for value in values):
+            return None, f"Filter '{field}' must be a string or a non-empty list of strings"
+        values = sorted({normalize_value(value).lstrip('.') if field == 'format' else normalize_value(value)
+                         for value in values})
+        if field == 'size' and not set(values) <= set(SIZE_BUCKET_NAMES):
+            return None, f"Filter 'size' must be one of {', '.join(SIZE_BUCKET_NAMES)}"
+        filters[field] = values
+    return filters, None
+
+
+class FilterIndex:
+    """
+    Boolean row masks for every filter value, aligned with the rows of an ``IndexData``.
+
+    ``masks[field][value][i]`` is true when row ``i`` has that format,
+    source or size bucket. A query's allowed rows are the OR of its values
+    within a field and the AND across fields, so filtering costs a few
+    vectorized boolean operations instead of a pass over the metadata.
+    """
+
+    def __init__(self, masks, n_rows):
+        self.masks = masks
+        self.n_rows = n_rows
+
+    @classmethod
+    def build(cls, metadata):
+        rows = {field: defaultdict(list) for field in FILTER_FIELDS}
+        for row, fields in enumerate(metadata):
+            if not fields:
+                continue
+            for value in format_values(fields.get('format')):
+                rows['format'][value].append(row)
+            rows['source'][normalize_value(fields.get('source'))].append(row)
+            rows['size'][size_bucket(fields.get('size'))].append(row)
+
+        masks = {}
+        for field, value_rows in rows.items():
+            masks[field] = {}
+            for value, members in value_rows.items():
+                mask = np.zeros(len(metadata), dtype=bool)
+                mask[members] = True
+                masks[field][value] = mask
+        return cls(masks, len(metadata))
+
+    def mask(self, filters):
+        """Return the boolean mask of the rows matching ``filters`` (as returned by ``parse_filters``)."""
+        selected = np.ones(self.n_rows, dtype=bool)
+        for field, values in filters.items():
+            field_mask = np.zeros(self.n_rows, dtype=bool)
+            for value in values:
+                value_mask = self.masks[field].get(value)
+                if value_mask is not None:
+                    field_mask |= value_mask
+            selected &= field_mask
+        return selected
+
+    def allowed_rows(self, filters):
+        """Return the sorted row indices matching ``filters``."""
+        return np.flatnonzero(self.mask(filters))
+
+
+_lock = threading.Lock()
+
+
+def get_filter_index(index_data):
+    """Return the filter masks for ``index_data``, building them on first use."""
+    filter_index = index_data.filter_index
+    if filter_index is None:
+        with _lock:
+            filter_index = index_data.filter_index
+            if filter_index is None:
+                filter_index = FilterIndex.build(index_data.metadata)
+                index_data.filter_index = filter_index
+    return filter_index
@@ -1,11 +1,15 @@
 # generate_embeddings.py
 
+import argparse
+import hashlib
+import json
+import multiprocessing
 import os
 import sys
+import time
 import numpy as np
 import pandas as pd
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sentence_transformers import SentenceTransformer
 import joblib
 from django.conf import settings
 import django
@@ -22,10 +26,15 @@ sys.path.append(os.path.join(project_root, 'backend'))
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 django.setup()
 
-from recommendations.models import Metadata, Embedding
+from django.db import transaction
+from django.utils import timezone
+from django.db.models import Exists, OuterRef, Q
+from recommendations.models import Metadata, Embedding, EmbeddingVector
+from recommendations.signals import invalidate_search_state
+from recommendations.embedding_codec import DEFAULT_DTYPE, encode_dense, encode_sparse
 
 # Load or create the TF-IDF vectorizer
-tfidf_vectorizer_path = os.path.join(settings.BASE_DIR, 'tfidf_vectorizer.pkl')
+tfidf_vectorizer_path = str(settings.TFIDF_VECTORIZER_PATH)
 tfidf_vectorizer = joblib.load(tfidf_vectorizer_path)
 # if os.path.exists(tfidf_vectorizer_path):
 #     tfidf_vectorizer = joblib.load(tfidf_vectorizer_path)
@@ -34,15 +43,127 @@ tfidf_vectorizer = joblib.load(tfidf_vectorizer_path)
 #     tfidf_vectorizer = TfidfVectorizer()
 #     print("Created new TF-IDF vectorizer.")
 
-# Load the SentenceTransformer model for BERT embeddings
-bert_model = SentenceTransformer('all-MiniLM-L6-v2')
+# The SentenceTransformer model for BERT embeddings, loaded on first use: with an encoding
+# pool this process only needs the tokenizer, and the workers load their own models
+bert_model = None
+bert_tokenizer = None
+
+def get_bert_model():
+    global bert_model
+    if bert_model is None:
+        # Imported here: sentence_transformers pulls in torch, which TF-IDF-only work never needs
+        from sentence_transformers import SentenceTransformer
+
+        bert_model = SentenceTransformer(settings.BERT_MODEL_NAME)
+    return bert_model
+
+def get_bert_tokenizer():
+    """Return ``(tokenizer, max_length)``, without loading the model weights unless they already are."""
+    global bert_tokenizer
+    if bert_model is not None:
+        return bert_model.tokenizer, bert_model.max_seq_length
+    if bert_tokenizer is None:
+        from transformers import AutoTokenizer
+
+        name = settings.BERT_MODEL_NAME
+        if '/' not in name and not os.path.exists(name):
+            # Short SentenceTransformer names live under the sentence-transformers organization
+            name = f"sentence-transformers/{name}"
+        bert_tokenizer = AutoTokenizer.from_pretrained(name)
+    return bert_tokenizer, bert_tokenizer.model_max_length
+
+def get_encoder_version():
+    """Identify the encoders: the BERT model name and a hash of the fitted vectorizer pickle."""
+    with open(tfidf_vectorizer_path, 'rb') as f:
+        tfidf_hash = hashlib.sha256(f.read()).hexdigest()[:16]
+    return f"{settings.BERT_MODEL_NAME}+tfidf:{tfidf_hash}"[:128]
+
+def normalize_text(text):
+    # Collapse whitespace only: it does not change the TF-IDF or BERT tokens, so equal
+    # normalized texts have equal vectors and can share one EmbeddingVector
+    return ' '.join(text.split())
+
+def content_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def stale_metadata(encoder_version):
+    """
+    Metadata rows without an embedding, edited since it was stored, embedded with other
+    encoders, or whose vectors are not in the shared vector store yet.
+    """
+    embeddings = Embedding.objects.filter(dataset=OuterRef('pk'))
+    stale = embeddings.filter(
+        Q(updated_at__lt=OuterRef('updated_at'))
+        | Q(vector__isnull=True)
+        | Q(content_hash__isnull=True)
+        | Q(encoder_version__isnull=True)
+        | ~Q(encoder_version=encoder_version)
+    )
+    return Metadata.objects.filter(~Exists(embeddings) | Exists(stale))
+
+def metadata_frame(rows, incremental=False, encoder_version=None):
+    """
+    Return a DataFrame of ``rows`` with their combined text and its hash.
+
+    With ``incremental``, rows whose stored embedding was made from the same
+    text with the same encoders are dropped (edited rows whose combined
+    text did not change); their embeddings' ``updated_at`` is bumped so
+    ``stale_metadata`` stops selecting them on later runs.
+    """
+    df = pd.DataFrame(rows, columns=['id', 'title', 'description'])
+    df['combined_text'] = (df['title'].fillna('') + ' ' + df['description'].fillna('')).map(normalize_text)
+    df['content_hash'] = [content_hash(text) for text in df['combined_text']]
+    if incremental and len(df):
+        existing_hashes = dict(
+            Embedding.objects.filter(dataset_id__in=df['id'].tolist(), encoder_version=encoder_version,
+                                     vector__isnull=False)
+            .values_list('dataset_id', 'content_hash')
+        )
+        unchanged = df['id'].map(existing_hashes) == df['content_hash']
+        if unchanged.any():
+            Embedding.objects.filter(dataset_id__in=df.loc[unchanged, 'id'].tolist()).update(updated_at=timezone.now())
+        df = df[~unchanged]
+    return df.reset_index(drop=True)
 
 # Function to fetch metadata
-def fetch_metadata():
-    metadata = Metadata.objects.all().values('id', 'title', 'description')
-    df = pd.DataFrame(metadata)
-    df['combined_text'] = df['title'].fillna('') + ' ' + df['description'].fillna('')
-    return df
+def iter_metadata_chunks(chunk_size, incremental=False, encoder_version=None, after_id=0):
+    """
+    Yield ``(df, last_id)`` for consecutive chunks of Metadata rows in id order.
+
+    Rows are streamed with ``iterator(chunk_size=...)``, so only one chunk is
+    held at a time. ``last_id`` is the highest id read for the chunk, even if
+    none of its rows needed embedding; ``after_id`` resumes after a checkpoint.
+    With ``incremental``, only new or changed datasets are returned, so the
+    cost of a run follows the size of the change set.
+    """
+    metadata = stale_metadata(encoder_version) if incremental else Metadata.objects.all()
+    rows = metadata.filter(id__gt=after_id).order_by('id').values('id', 'title', 'description')
+    chunk = []
+    for row in rows.iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield metadata_frame(chunk, incremental, encoder_version), chunk[-1]['id']
+            chunk = []
+    if chunk:
+        yield metadata_frame(chunk, incremental, encoder_version), chunk[-1]['id']
+
+def load_checkpoint(path, mode, encoder_version):
+    """Return the checkpoint left by an interrupted run of the same mode and encoders, or ``None``."""
+    try:
+        with open(path) as f:
+            checkpoint = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if checkpoint.get('mode') != mode or checkpoint.get('encoder_version') != encoder_version:
+        return None
+    return checkpoint
+
+def save_checkpoint(path, checkpoint):
+    # Write then rename, so a kill mid-write never leaves a truncated checkpoint
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
 
 # Function to generate TF-IDF embeddings
 def generate_tfidf_embeddings(texts):
@@ -55,44 +176,265 @@ def generate_tfidf_embeddings(texts):
     else:
         # Use the loaded vectorizer
         tfidf_embeddings = tfidf_vectorizer.transform(texts)
-        print("TF-IDF embeddings generated using existing vectorizer.")
     return tfidf_embeddings
 
+def length_sorted_batches(texts, batch_size):
+    """
+    Sort ``texts`` by token length and cut them into batches of ``batch_size``.
+
+    Returns ``(order, batches)`` where ``order[i]`` is the position in
+    ``texts`` of the i-th sorted text. Batching texts of similar length keeps
+    short descriptions from being padded to the longest one in their batch.
+    """
+    tokenizer, max_length = get_bert_tokenizer()
+    token_ids = tokenizer(texts, truncation=True, max_length=max_length)['input_ids']
+    order = np.argsort([len(ids) for ids in token_ids], kind='stable')
+    sorted_texts = [texts[i] for i in order]
+    return order, [sorted_texts[start:start + batch_size] for start in range(0, len(texts), batch_size)]
+
+def unsort_embeddings(order, batch_embeddings):
+    """Concatenate the embeddings of ``length_sorted_batches`` back into the original text order."""
+    sorted_embeddings = np.concatenate(batch_embeddings)
+    embeddings = np.empty_like(sorted_embeddings)
+    embeddings[order] = sorted_embeddings
+    return embeddings
+
+# Model of a pool worker process, loaded by init_encoder_worker
+worker_model = None
+
+def init_encoder_worker(model_name, threads):
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    global worker_model
+    # Pin intra-op threads so the workers do not oversubscribe the cores between them
+    torch.set_num_threads(threads)
+    worker_model = SentenceTransformer(model_name, device='cpu')
+
+def encode_batch(texts):
+    return worker_model.encode(texts, batch_size=len(texts), show_progress_bar=False)
+
+class EncodingPool:
+    """
+    Process pool encoding BERT embeddings on CPU, one SentenceTransformer per worker.
+
+    Texts are length-bucketed into batches which are spread over the workers
+    and merged back in input order. Workers are forked, so they share the
+    already-imported libraries but load their own model and use ``threads``
+    torch threads each (0 divides the cores evenly between the workers).
+    """
+
+    def __init__(self, workers, threads=0, batch_size=32):
+        self.workers = workers
+        self.threads = threads or max(1, (os.cpu_count() or 1) // workers)
+        self.batch_size = batch_size
+        self._pool = multiprocessing.get_context('fork').Pool(
+            workers, initializer=init_encoder_worker, initargs=(settings.BERT_MODEL_NAME, self.threads))
+
+    def encode(self, texts):
+        order, batches = length_sorted_batches(texts, self.batch_size)
+        # map returns the batches in order; chunksize=1 balances the longer batches at the end
+        return unsort_embeddings(order, self._pool.map(encode_batch, batches, chunksize=1))
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
 # Function to generate BERT embeddings
-def generate_bert_embeddings(texts):
-    bert_embeddings = bert_model.encode(texts, show_progress_bar=True)
-    return bert_embeddings
+def generate_bert_embeddings(texts, pool=None, batch_size=None):
+    if pool is not None:
+        return pool.encode(texts)
+    model = get_bert_model()
+    order, batches = length_sorted_batches(texts, batch_size or settings.EMBEDDING_ENCODE_BATCH_SIZE)
+    return unsort_embeddings(order, [model.encode(batch, batch_size=len(batch), show_progress_bar=False)
+                                     for batch in batches])
 
-# Function to store embeddings
-def store_embeddings(df, tfidf_embeddings, bert_embeddings):
+# Columns overwritten when an embedding for the dataset already exists; the inline vector
+# columns are cleared since the vectors now live on the shared EmbeddingVector
+UPSERT_FIELDS = [
+    'vector', 'tfidf_indices', 'tfidf_values', 'tfidf_dim', 'bert_vector', 'bert_dim', 'vector_dtype',
+    'combined_normalized_text', 'content_hash', 'encoder_version', 'updated_at',
+]
+
+def stored_vector_ids(hashes, encoder_version):
+    """Map each of ``hashes`` already in the vector store to its EmbeddingVector id."""
+    return dict(
+        EmbeddingVector.objects.filter(content_hash__in=list(hashes), encoder_version=encoder_version)
+        .values_list('content_hash', 'id')
+    )
+
+def store_vectors(df, tfidf_embeddings, bert_embeddings, encoder_version, chunk_size=None):
+    """Insert one EmbeddingVector per row of ``df`` (distinct texts), skipping hashes stored meanwhile."""
+    tfidf_embeddings = tfidf_embeddings.tocsr()
+    vectors = []
     for index, row in df.iterrows():
-        tfidf_embedding = tfidf_embeddings[index].toarray().tolist()[0]
-        bert_embedding = bert_embeddings[index].tolist()
-
-        embedding, created = Embedding.objects.update_or_create(
-            dataset_id=row['id'],
-            defaults={
-                'tfidf_embedding': tfidf_embedding,
-                'bert_embedding': bert_embedding,
-                'combined_normalized_text': row['combined_text']
-            }
-        )
-        if created:
-            print(f"Created new embedding for dataset ID {row['id']}.")
-        else:
-            print(f"Updated embedding for dataset ID {row['id']}.")
+        # Store only the non-zero TF-IDF weights; rows are mostly zeros
+        tfidf_row = tfidf_embeddings[index]
+        tfidf_indices, tfidf_values = encode_sparse(tfidf_row.indices, tfidf_row.data)
+        bert_vector, bert_dim = encode_dense(bert_embeddings[index])
+        vectors.append(EmbeddingVector(
+            content_hash=row['content_hash'],
+            encoder_version=encoder_version,
+            tfidf_indices=tfidf_indices,
+            tfidf_values=tfidf_values,
+            tfidf_dim=tfidf_row.shape[1],
+            bert_vector=bert_vector,
+            bert_dim=bert_dim,
+            vector_dtype=DEFAULT_DTYPE,
+        ))
+    EmbeddingVector.objects.bulk_create(vectors, ignore_conflicts=True,
+                                        batch_size=chunk_size or settings.EMBEDDING_WRITE_CHUNK_SIZE)
+
+# Function to store embeddings
+def store_embeddings(df, vector_ids, encoder_version=None, chunk_size=None):
+    """
+    Upsert one Embedding per row of ``df``, ``chunk_size`` rows per statement.
+
+    Every row references the EmbeddingVector of its content hash in
+    ``vector_ids``. All statements run in one transaction and each is a
+    single ``bulk_create(update_conflicts=True)``, relying on the unique
+    constraint on ``Embedding.dataset``. Bulk writes send no model signals;
+    callers invalidate the search caches once they are done writing.
+    """
+    chunk_size = chunk_size or settings.EMBEDDING_WRITE_CHUNK_SIZE
+    with transaction.atomic():
+        for start in range(0, len(df), chunk_size):
+            chunk = [
+                Embedding(
+                    dataset_id=row['id'],
+                    vector_id=vector_ids[row['content_hash']],
+                    tfidf_indices=None,
+                    tfidf_values=None,
+                    tfidf_dim=None,
+                    bert_vector=None,
+                    bert_dim=None,
+                    vector_dtype=DEFAULT_DTYPE,
+                    combined_normalized_text=row['combined_text'],
+                    content_hash=row['content_hash'],
+                    encoder_version=encoder_version,
+                )
+                for _, row in df.iloc[start:start + chunk_size].iterrows()
+            ]
+            Embedding.objects.bulk_create(chunk, update_conflicts=True, unique_fields=['dataset'],
+                                          update_fields=UPSERT_FIELDS)
+
+def embed_chunk(df, encoder_version, pool=None, write_chunk_size=None):
+    """
+    Encode the distinct texts of ``df`` missing from the vector store and upsert its embeddings.
+
+    Datasets with the same normalized text (mirrors, forks) are encoded
+    once and reference the same EmbeddingVector. Returns the number of
+    texts encoded.
+    """
+    vector_ids = stored_vector_ids(df['content_hash'].unique(), encoder_version)
+    new_texts = df[~df['content_hash'].isin(vector_ids)].drop_duplicates('content_hash').reset_index(drop=True)
+    with transaction.atomic():
+        if len(new_texts):
+            # Generate embeddings
+            tfidf_embeddings = generate_tfidf_embeddings(new_texts['combined_text'])
+            bert_embeddings = generate_bert_embeddings(new_texts['combined_text'].tolist(), pool=pool)
+            store_vectors(new_texts, tfidf_embeddings, bert_embeddings, encoder_version, chunk_size=write_chunk_size)
+            vector_ids.update(stored_vector_ids(new_texts['content_hash'], encoder_version))
+
+        # Store embeddings
+        store_embeddings(df, vector_ids, encoder_version, chunk_size=write_chunk_size)
+    return len(new_texts)
+
+def delete_orphan_vectors():
+    """Delete EmbeddingVectors no Embedding references any more (texts that were edited away)."""
+    orphans = EmbeddingVector.objects.filter(~Exists(Embedding.objects.filter(vector=OuterRef('pk'))))
+    deleted, _ = orphans.delete()
+    return deleted
 
 # Main function
-def process_metadata_for_embeddings():
-    df = fetch_metadata()
+def process_metadata_for_embeddings(incremental=True, chunk_size=None, write_chunk_size=None,
+                                    checkpoint_path=None, restart=False, workers=None):
+    """
+    Embed Metadata rows one chunk at a time: read, encode, write, checkpoint.
+
+    Only one chunk of rows, texts and vectors is held in memory, so peak
+    memory follows ``chunk_size`` rather than the table size. After each
+    chunk is committed its last id is saved to ``checkpoint_path``; a run of
+    the same mode and encoders that finds the checkpoint resumes after that
+    id (unless ``restart``). The checkpoint is removed once the run finishes.
+    With more than one of ``workers``, BERT encoding runs on an ``EncodingPool``.
+    Each distinct text is encoded once per encoder version; the run reports
+    the dedup ratio, embeddings stored per text actually encoded.
+    """
+    chunk_size = chunk_size or settings.EMBEDDING_READ_CHUNK_SIZE
+    checkpoint_path = str(checkpoint_path or settings.EMBEDDING_CHECKPOINT_PATH)
+    mode = 'incremental' if incremental else 'full'
+    encoder_version = get_encoder_version()
+
+    checkpoint = None if restart else load_checkpoint(checkpoint_path, mode, encoder_version)
+    if checkpoint:
+        print(f"Resuming {mode} run after dataset id {checkpoint['last_id']} "
+              f"({checkpoint['processed']} embeddings already stored).")
+    else:
+        checkpoint = {'mode': mode, 'encoder_version': encoder_version, 'last_id': 0, 'processed': 0}
+    checkpoint.setdefault('encoded', 0)
+
+    workers = settings.EMBEDDING_ENCODE_WORKERS if workers is None else workers
+    pool = None
+    if workers > 1:
+        pool = EncodingPool(workers, threads=settings.EMBEDDING_ENCODE_THREADS,
+                            batch_size=settings.EMBEDDING_ENCODE_BATCH_SIZE)
+        print(f"Encoding with {workers} worker processes, {pool.threads} torch threads each.")
+
+    started = time.perf_counter()
+    processed = 0
+    chunks = iter_metadata_chunks(chunk_size, incremental=incremental, encoder_version=encoder_version,
+                                  after_id=checkpoint['last_id'])
+    try:
+        for df, last_id in chunks:
+            if len(df):
+                checkpoint['encoded'] += embed_chunk(df, encoder_version, pool, write_chunk_size)
+                processed += len(df)
+
+            checkpoint['last_id'] = last_id
+            checkpoint['processed'] += len(df)
+            save_checkpoint(checkpoint_path, checkpoint)
+            elapsed = time.perf_counter() - started
+            print(f"Stored {checkpoint['processed']} embeddings through dataset id {last_id} "
+                  f"({processed / max(elapsed, 1e-9):.0f} rows/sec).")
+    finally:
+        if pool is not None:
+            pool.close()
 
-    # Generate embeddings
-    tfidf_embeddings = generate_tfidf_embeddings(df['combined_text'])
-    bert_embeddings = generate_bert_embeddings(df['combined_text'])
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    if not processed:
+        print("All embeddings are up to date.")
+        return
 
-    # Store embeddings
-    store_embeddings(df, tfidf_embeddings, bert_embeddings)
+    orphans = delete_orphan_vectors()
+    # Bulk writes send no model signals; drop the in-memory index and cached results once
+    invalidate_search_state(sender=Embedding)
+    elapsed = time.perf_counter() - started
+    print(f"Embedded {processed} datasets ({mode} run) in {elapsed:.2f}s "
+          f"({processed / max(elapsed, 1e-9):.0f} rows/sec).")
+    total, encoded = checkpoint['processed'], checkpoint['encoded']
+    print(f"Encoded {encoded} distinct texts for {total} datasets: dedup ratio "
+          f"{total / max(encoded, 1):.2f} ({total - encoded} encodes saved); "
+          f"{EmbeddingVector.objects.count()} vectors stored, {orphans} unreferenced vectors deleted.")
 
 # Run the process
 if __name__ == "__main__":
-    process_metadata_for_embeddings()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate TF-IDF and BERT embeddings for Metadata rows.")
+    parser.add_argument('--full', action='store_true',
+                        help="Re-embed every dataset instead of only new or changed ones "
+                             "(texts already in the vector store are not encoded again).")
+    parser.add_argument('--chunk-size', type=int, default=settings.EMBEDDING_READ_CHUNK_SIZE,
+                        help="Datasets read, encoded and committed per checkpoint.")
+    parser.add_argument('--write-chunk-size', type=int, default=settings.EMBEDDING_WRITE_CHUNK_SIZE,
+                        help="Embeddings upserted per statement.")
+    parser.add_argument('--checkpoint', default=str(settings.EMBEDDING_CHECKPOINT_PATH),
+                        help="File recording the last committed dataset id of an interrupted run.")
+    parser.add_argument('--workers', type=int, default=settings.EMBEDDING_ENCODE_WORKERS,
+                        help="BERT encoding processes (0 or 1 encodes in this process).")
+    parser.add_argument('--restart', action='store_true',
+                        help="Ignore the checkpoint of an interrupted run and start from the first dataset.")
+    args = parser.parse_args()
+    process_metadata_for_embeddings(incremental=not args.full, chunk_size=args.chunk_size,
+                                    write_chunk_size=args.write_chunk_size, checkpoint_path=args.checkpoint,
+                                    restart=args.restart, workers=args.workers)
@@ -0,0 +1,179 @@
+import logging
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+from scipy import sparse
+
+logger = logging.getLogger(__name__)
+
+
+class InvertedIndex:
+    """
+    Term -> postings index over the embedding index rows.
+
+    Postings are stored CSC-style: the rows containing term ``t`` are
+    ``rows[ptr[t]:ptr[t + 1]]`` (sorted) with the matching term weights in
+    ``weights``. Scoring only touches the posting lists of the query terms,
+    so its cost follows posting-list length rather than corpus size.
+
+    ``scoring`` is ``'tfidf'`` (weights are the stored, L2-normalized TF-IDF
+    values, so a query scores its cosine similarity) or ``'bm25'``.
+    """
+
+    def __init__(self, ptr, rows, weights, n_rows, scoring, vocabulary, analyzer):
+        self.ptr = ptr
+        self.rows = rows
+        self.weights = weights
+        self.n_rows = n_rows
+        self.scoring = scoring
+        self.vocabulary = vocabulary
+        self.analyzer = analyzer
+        self.key = None  # (scoring, vectorizer version), set by get_lexical_index()
+        # Largest weight of every posting list, the per-term MaxScore upper bound
+        self.max_weights = np.zeros(len(ptr) - 1, dtype=np.float32)
+        non_empty = np.flatnonzero(np.diff(ptr))
+        if len(non_empty):
+            self.max_weights[non_empty] = np.maximum.reduceat(weights, ptr[non_empty])
+
+    @classmethod
+    def from_tfidf_matrix(cls, tfidf_matrix, vectorizer):
+        """Invert the stored TF-IDF matrix; weights are the TF-IDF values themselves."""
+        csc = sparse.csc_matrix(tfidf_matrix, dtype=np.float32)
+        csc.sort_indices()
+        return cls(csc.indptr.astype(np.int64), csc.indices.astype(np.int64), csc.data,
+                   csc.shape[0], 'tfidf', vectorizer.vocabulary_, vectorizer.build_analyzer())
+
+    @classmethod
+    def from_texts(cls, texts, vectorizer, k1=1.2, b=0.75):
+        """
+        Build BM25 postings from ``texts`` using the vectorizer's analyzer and vocabulary.
+
+        Tokens outside the saved vocabulary are ignored, so query and corpus
+        share the term space of ``tfidf_vectorizer.pkl``.
+        """
+        analyzer = vectorizer.build_analyzer()
+        vocabulary = vectorizer.vocabulary_
+        doc_rows, term_ids, term_freqs = [], [], []
+        doc_lengths = np.zeros(len(texts), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = analyzer(text or '')
+            doc_lengths[row] = len(tokens)
+            counts = Counter(vocabulary[token] for token in tokens if token in vocabulary)
+            doc_rows.extend([row] * len(counts))
+            term_ids.extend(counts.keys())
+            term_freqs.extend(counts.values())
+
+        tf = sparse.csc_matrix(
+            (np.asarray(term_freqs, dtype=np.float32), (doc_rows, term_ids)),
+            shape=(len(texts), len(vocabulary)),
+        )
+        tf.sort_indices()
+        rows = tf.indices.astype(np.int64)
+        freqs = tf.data
+
+        n_docs = max(len(texts), 1)
+        avg_length = max(float(doc_lengths.mean()) if len(texts) else 0.0, 1.0)
+        doc_freqs = np.diff(tf.indptr)
+        idf = np.log1p((n_docs - doc_freqs + 0.5) / (doc_freqs + 0.5)).astype(np.float32)
+        term_of_posting = np.repeat(np.arange(len(doc_freqs)), doc_freqs)
+        norm = k1 * (1 - b + b * doc_lengths[rows] / avg_length)
+        weights = idf[term_of_posting] * freqs * (k1 + 1) / (freqs + norm)
+
+        return cls(tf.indptr.astype(np.int64), rows, weights.astype(np.float32),
+                   len(texts), 'bm25', vocabulary, analyzer)
+
+    def query_terms(self, query, query_tfidf):
+        """
+        Return ``(term_ids, query_weights)`` for ``query``.
+
+        TF-IDF scoring reuses the query's sparse TF-IDF vector; BM25 weighs
+        each term by its number of occurrences in the query.
+        """
+        if self.scoring == 'tfidf':
+            return query_tfidf.indices.astype(np.int64), query_tfidf.data.astype(np.float32)
+        counts = Counter(self.vocabulary[token] for token in self.analyzer(query) if token in self.vocabulary)
+        return (np.fromiter(counts.keys(), dtype=np.int64, count=len(counts)),
+                np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+
+    def _postings(self, term):
+        start, end = self.ptr[term], self.ptr[term + 1]
+        return self.rows[start:end], self.weights[start:end]
+
+    def score(self, term_ids, query_weights, top_k=None):
+        """
+        Score the rows sharing at least one term with the query.
+
+        Without ``top_k`` every posting of every query term is accumulated.
+        With ``top_k`` the exact best ``top_k`` rows are found with MaxScore:
+        terms are visited by decreasing upper bound, and once the remaining
+        terms' bounds cannot lift an unseen row above the current k-th score,
+        their postings are only probed (binary search) for rows already
+        accumulated instead of being scanned.
+
+        Returns:
+            tuple: ``(rows, scores)`` as sorted row indices and their scores.
+        """
+        upper_bounds = self.max_weights[term_ids] * query_weights
+        order = np.argsort(-upper_bounds, kind='stable')
+        term_ids, query_weights, upper_bounds = term_ids[order], query_weights[order], upper_bounds[order]
+        remaining = np.concatenate([np.cumsum(upper_bounds[::-1])[::-1], [0.0]])
+
+        cand_rows = np.empty(0, dtype=np.int64)
+        cand_scores = np.empty(0, dtype=np.float32)
+        for i, (term, weight) in enumerate(zip(term_ids.tolist(), query_weights.tolist())):
+            threshold = None
+            if top_k and len(cand_rows) >= top_k:
+                threshold = np.partition(cand_scores, len(cand_scores) - top_k)[len(cand_scores) - top_k]
+
+            rows, weights = self._postings(term)
+            if threshold is None or remaining[i] > threshold:
+                # Essential term: unseen rows may still reach the top k
+                merged_rows = np.concatenate([cand_rows, rows])
+                merged_scores = np.concatenate([cand_scores, weights * weight])
+                cand_rows, inverse = np.unique(merged_rows, return_inverse=True)
+                cand_scores = np.bincount(inverse, weights=merged_scores).astype(np.float32)
+                continue
+
+            # Non-essential term: drop rows that cannot catch up, probe the rest
+            keep = cand_scores + remaining[i] >= threshold
+            cand_rows, cand_scores = cand_rows[keep], cand_scores[keep]
+            if len(rows):
+                positions = np.minimum(np.searchsorted(rows, cand_rows), len(rows) - 1)
+                hit = rows[positions] == cand_rows
+                cand_scores[hit] += weights[positions[hit]] * weight
+
+        if top_k and len(cand_rows) > top_k:
+            best = np.sort(np.argpartition(-cand_scores, top_k - 1)[:top_k])
+            cand_rows, cand_scores = cand_rows[best], cand_scores[best]
+        return cand_rows, cand_scores
+
+
+_lock = threading.Lock()
+
+
+def get_lexical_index(index_data, vectorizer, vectorizer_version, scoring, k1=1.2, b=0.75):
+    """
+    Return the inverted index for ``index_data``, building it on first use.
+
+    The index is cached on the ``IndexData`` snapshot, so it is rebuilt
+    whenever the embedding index reloads or the vectorizer changes.
+    """
+    key = (scoring, vectorizer_version)
+    lexical = index_data.lexical_index
+    if lexical is not None and lexical.key == key:
+        return lexical
+    with _lock:
+        lexical = index_data.lexical_index
+        if lexical is None or lexical.key != key:
+            started = time.perf_counter()
+            if scoring == 'bm25':
+                lexical = InvertedIndex.from_texts(index_data.texts, vectorizer, k1=k1, b=b)
+            else:
+                lexical = InvertedIndex.from_tfidf_matrix(index_data.tfidf_matrix, vectorizer)
+            lexical.key = key
+            index_data.lexical_index = lexical
+            logger.info(f"Built {scoring} inverted index over {lexical.n_rows} rows "
+                        f"in {time.perf_counter() - started:.2f}s")
+        return lexical
@@ -0,0 +1,71 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+
+from recommendations.query_processing.query_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+
+def popular_queries(limit, days=None):
+    """
+    Return up to ``limit`` logged query texts, most frequent first.
+
+    Texts that only differ in case or spacing count as one query, returned
+    as its most frequent spelling, so a cased encoder warms up on what users
+    type rather than the lower-cased cache key. With ``days``, only queries
+    logged in that many past days are considered.
+    """
+    from recommendations.models import Query
+
+    queries = Query.objects.all()
+    if days:
+        queries = queries.filter(created_at__gte=timezone.now() - timedelta(days=days))
+    counts = {}
+    spellings = {}
+    # Over-fetch raw texts so variants of one query still leave ``limit`` distinct ones
+    rows = queries.values('query_text').annotate(n=Count('id')).order_by('-n')[:limit * 4]
+    for row in rows.iterator():
+        key = normalize_query(row['query_text'])
+        if key:
+            counts[key] = counts.get(key, 0) + row['n']
+            # Rows arrive most frequent first, so the first spelling seen is the most common one
+            spellings.setdefault(key, row['query_text'])
+    return [spellings[key] for key in sorted(counts, key=counts.get, reverse=True)[:limit]]
+
+
+def prewarm_caches(max_queries=None, max_seconds=None, days=None, top_k=None, chunk_size=32):
+    """
+    Rank the most popular logged queries to fill the query-embedding and result caches.
+
+    Queries are encoded and scored ``chunk_size`` at a time with the default
+    ``top_k`` and no offset or filters, which is what a plain search asks
+    for. Stops once ``max_queries`` are warm or ``max_seconds`` have passed.
+    Warming does not write query logs.
+
+    Returns:
+        dict: ``queries`` warmed, ``candidates`` found in the logs, and ``seconds`` spent.
+    """
+    from recommendations.query_processing.process_query import process_queries
+
+    max_queries = settings.QUERY_PREWARM_MAX_QUERIES if max_queries is None else max_queries
+    max_seconds = settings.QUERY_PREWARM_MAX_SECONDS if max_seconds is None else max_seconds
+    days = settings.QUERY_PREWARM_DAYS if days is None else days
+
+    started = time.perf_counter()
+    texts = popular_queries(max_queries, days=days)
+    warmed = 0
+    for start in range(0, len(texts), chunk_size):
+        if max_seconds and time.perf_counter() - started >= max_seconds:
+            break
+        chunk = texts[start:start + chunk_size]
+        process_queries(chunk, top_k=top_k, log=False)
+        warmed += len(chunk)
+
+    report = {'queries': warmed, 'candidates': len(texts), 'seconds': round(time.perf_counter() - started, 3)}
+    logger.info(f"Pre-warmed caches with {warmed} of {len(texts)} popular queries in {report['seconds']}s")
+    return report
@@ -1,110 +1,433 @@
-import os
 import logging
-import sys
+import threading
+import time
 import numpy as np
-import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
-from sentence_transformers import SentenceTransformer
-import joblib
-from decouple import config
-import django
+from asgiref.sync import sync_to_async
+from scipy import sparse
 from django.conf import settings
 
+from recommendations.query_processing.ann_index import get_ann_index
+from recommendations.query_processing.batching import get_encode_batcher
+from recommendations.query_processing.embedding_index import (
+    embedding_index, load_bert_rows, normalize_dense_rows, normalize_sparse_rows,
+)
+from recommendations.query_processing.encoders import get_bert_model, get_tfidf_vectorizer, query_embedding_cache
+from recommendations.query_processing.filters import get_filter_index
+from recommendations.query_processing.lexical_index import get_lexical_index
+from recommendations.query_processing.query_cache import normalize_query
+from recommendations.query_processing.query_log import log_query
+from recommendations.query_processing.ranking import select_top_k
+from recommendations.query_processing.result_cache import get_result_cache, make_key
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Add the project root and backend directory to sys.path
-project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
-sys.path.append(project_root)
-sys.path.append(os.path.join(project_root, 'backend'))
+# Hybrid score = TFIDF_WEIGHT * lexical similarity + BERT_WEIGHT * BERT similarity
+TFIDF_WEIGHT = 0.3
+BERT_WEIGHT = 0.7
+
+# Score buffers up to this many floats (32 MB) are kept for reuse per thread
+MAX_CACHED_SCORE_BUFFER = 8 * 1024 * 1024
+_score_buffers = threading.local()
+
+def _cached_embeddings(kind, version, queries, encode):
+    """
+    Return one single-row embedding per query, encoding cache misses in one call.
+
+    Entries are keyed by ``(kind, encoder version, normalized query)``; a miss
+    encodes the original text of its first occurrence, so cased models see
+    the query as typed.
+    """
+    keys = [(kind, version, normalize_query(query)) for query in queries]
+    embeddings = [query_embedding_cache.get(key) for key in keys]
+    missing = {}
+    for query, key, embedding in zip(queries, keys, embeddings):
+        if embedding is None:
+            missing.setdefault(key, query)
+    if missing:
+        encoded = encode(list(missing.values()))
+        fresh = {}
+        for i, key in enumerate(missing):
+            embedding = encoded[i:i + 1]
+            if isinstance(embedding, np.ndarray):
+                # Copy so the cache does not keep the whole batch alive
+                embedding = embedding.copy()
+                embedding.setflags(write=False)
+            query_embedding_cache.set(key, embedding)
+            fresh[key] = embedding
+        embeddings = [fresh[key] if embedding is None else embedding for key, embedding in zip(keys, embeddings)]
+    return embeddings
 
-# Set up Django environment
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
-django.setup()
+def generate_tfidf_embeddings(queries):
+    vectorizer, version = get_tfidf_vectorizer()
+    # Keep the queries sparse; they are scored against the sparse corpus matrix
+    rows = _cached_embeddings('tfidf', version, queries, lambda texts: vectorizer.transform(texts).astype(np.float32))
+    return sparse.vstack(rows, format='csr')
 
-from recommendations.models import Metadata, Embedding  # Adjust the import path as needed
+def _encode_bert(model, texts):
+    # Single-query misses from concurrent requests share one forward pass
+    if settings.QUERY_BATCHING_ENABLED and len(texts) == 1:
+        return get_encode_batcher().encode(texts[0])
+    return model.encode(texts)
 
-# Load the saved TF-IDF vectorizer and BERT model
-tfidf_vectorizer_path = os.path.join(settings.BASE_DIR, 'tfidf_vectorizer.pkl')
-tfidf_vectorizer = joblib.load(tfidf_vectorizer_path)
+def generate_bert_embeddings(queries):
+    model, version = get_bert_model()
+    rows = _cached_embeddings('bert', version, queries, lambda texts: _encode_bert(model, texts))
+    return np.vstack(rows).astype(np.float32, copy=False)
 
-bert_model = SentenceTransformer('all-MiniLM-L6-v2')
+async def aencode_bert_query(query_text):
+    """
+    Encode ``query_text`` through the encode batcher, awaiting it on the event
+    loop, and put it in the query embedding cache.
+
+    Async views call this before handing the query to the thread pool, so
+    pool threads only score; already cached queries are not encoded again.
+    """
+    _, version = await sync_to_async(get_bert_model, thread_sensitive=False)()
+    key = ('bert', version, normalize_query(query_text))
+    if query_embedding_cache.get(key) is None:
+        embedding = await get_encode_batcher().aencode(query_text)
+        embedding.setflags(write=False)
+        query_embedding_cache.set(key, embedding)
 
 def generate_tfidf_embedding(query):
-    return tfidf_vectorizer.transform([query]).toarray().astype(np.float32)
+    return generate_tfidf_embeddings([query])
 
 def generate_bert_embedding(query):
-    return bert_model.encode([query])
+    return generate_bert_embeddings([query])
+
+def score_buffer(n_queries, n_rows):
+    """
+    Return a float32 ``(n_queries, n_rows)`` scratch matrix for combined scores.
+
+    The buffer is kept per thread and reused by later calls, so scoring does
+    not allocate a fresh corpus-sized matrix per query. Buffers above
+    ``MAX_CACHED_SCORE_BUFFER`` floats (large batches) are not kept.
+    """
+    size = n_queries * n_rows
+    buffer = getattr(_score_buffers, 'scores', None)
+    if buffer is None or buffer.size < size:
+        buffer = np.empty(size, dtype=np.float32)
+        if size <= MAX_CACHED_SCORE_BUFFER:
+            _score_buffers.scores = buffer
+    return buffer[:size].reshape(n_queries, n_rows)
+
+def _dot_rows(bert_matrix, vector, rows):
+    if isinstance(bert_matrix, np.ndarray):
+        return bert_matrix[rows] @ vector
+    return bert_matrix.dot_rows(vector, rows)
+
+def _allowed_columns(rows, allowed):
+    """
+    Map index ``rows`` onto the columns of a score matrix restricted to ``allowed``.
+
+    Returns ``(keep, columns)``: which of ``rows`` pass the filters, and the
+    columns of those that do.
+    """
+    columns = np.minimum(np.searchsorted(allowed, rows), len(allowed) - 1)
+    keep = allowed[columns] == rows
+    return keep, columns[keep]
+
+def score_bert(query_bert, index, out, allowed=None, min_candidates=0):
+    """
+    Write the weighted BERT cosine similarity of each query into ``out``.
+
+    ``query_bert`` must be L2-normalized and pre-multiplied by ``BERT_WEIGHT``;
+    the corpus rows are normalized at load time, so one BLAS matrix product
+    writes the weighted similarities straight into ``out`` (a quantized
+    matrix computes the same product from its codes).
+
+    ``out`` is ``(Q, N)``, or ``(Q, len(allowed))`` when the query is
+    filtered; column ``j`` then belongs to row ``allowed[j]`` and only the
+    allowed rows are scored.
+
+    With ``BERT_SEARCH_BACKEND = 'ivf'`` only the rows in the probed IVF lists
+    are scored; the remaining rows get a BERT similarity of 0. A filtered
+    query probes further lists until ``min_candidates`` allowed rows are
+    found, and falls back to exact scoring when the filter leaves fewer rows
+    than the probed lists would hold.
+
+    Returns:
+        list: The scored rows of each query, or ``None`` when every row was scored.
+    """
+    bert_matrix = index.bert_matrix
+    ann = get_ann_index() if settings.BERT_SEARCH_BACKEND == 'ivf' else None
+    if ann is not None and allowed is not None and len(allowed) * ann.n_lists <= settings.BERT_ANN_NPROBE * len(index):
+        ann = None
+    if ann is None:
+        if allowed is None and isinstance(bert_matrix, np.ndarray):
+            np.matmul(query_bert, bert_matrix.T, out=out)
+        elif allowed is None:
+            bert_matrix.dot(query_bert, out)
+        elif isinstance(bert_matrix, np.ndarray):
+            np.matmul(query_bert, bert_matrix[allowed].T, out=out)
+        else:
+            for i, vector in enumerate(query_bert):
+                out[i] = bert_matrix.dot_rows(vector, allowed)
+        return None
+
+    out.fill(0.0)
+    probed = []
+    for i, vector in enumerate(query_bert):
+        rows = ann.candidate_rows(vector, index.dataset_ids, settings.BERT_ANN_NPROBE,
+                                  allowed=allowed, min_candidates=min_candidates)
+        columns = rows if allowed is None else np.searchsorted(allowed, rows)
+        out[i, columns] = _dot_rows(bert_matrix, vector, rows)
+        probed.append(rows)
+    return probed
+
+def rerank_bert(query_bert, index, scores, n_candidates, probed=None, allowed=None):
+    """
+    Re-score each query's best ``n_candidates`` rows with full-precision BERT vectors.
+
+    The quantized BERT term of those rows in ``scores`` is replaced by the
+    exact one, taken from the snapshot mapping when there is one and
+    otherwise read for the candidates only with ``load_bert_rows()``.
+    Candidates whose embedding was deleted since the index loaded keep
+    their approximate score.
+
+    Returns:
+        list: The candidate columns of ``scores`` for each query.
+    """
+    candidates = [select_top_k(row_scores, n_candidates) for row_scores in scores]
+    all_rows = np.unique(np.concatenate(candidates))
+    if allowed is not None:
+        all_rows = allowed[all_rows]
+    if index.full_bert_matrix is not None:
+        full_vectors = index.full_bert_matrix[all_rows]
+        found = np.ones(len(all_rows), dtype=bool)
+    else:
+        full_vectors, found = load_bert_rows(index.dataset_ids[all_rows].tolist(), index.bert_matrix.shape[1])
+    for i, columns in enumerate(candidates):
+        rows = columns if allowed is None else allowed[columns]
+        approx = _dot_rows(index.bert_matrix, query_bert[i], rows)
+        if probed is not None:
+            # Rows outside the probed IVF lists carry no BERT term yet
+            approx[~np.isin(rows, probed[i])] = 0.0
+        positions = np.searchsorted(all_rows, rows)
+        correction = full_vectors[positions] @ query_bert[i] - approx
+        correction[~found[positions]] = 0.0
+        scores[i, columns] += correction
+    return candidates
+
+def score_tfidf(query_texts, query_tfidf, index, out, allowed=None):
+    """
+    Add the weighted lexical similarity of each query to ``out``.
+
+    ``LEXICAL_BACKEND = 'cosine'`` multiplies the L2-normalized query rows with
+    the term-major corpus matrix, so only posting rows of the query terms are
+    read; ``'tfidf'`` and ``'bm25'`` walk the inverted index. Either way only
+    the rows sharing a term with the query are touched (BM25 scores are
+    divided by the query's best score so they blend with the cosine BERT leg).
+    With ``allowed``, scores of filtered-out rows are dropped and ``out``
+    follows the column layout described in ``score_bert``.
+    """
+    backend = settings.LEXICAL_BACKEND
+    if backend == 'cosine':
+        product = query_tfidf @ index.tfidf_matrix_t
+        query_rows = np.repeat(np.arange(product.shape[0]), np.diff(product.indptr))
+        columns, values = product.indices, product.data
+        if allowed is not None:
+            keep, columns = _allowed_columns(columns, allowed)
+            query_rows, values = query_rows[keep], values[keep]
+        # A canonical CSR product has no duplicate entries, so fancy += is exact
+        out[query_rows, columns] += TFIDF_WEIGHT * values
+        return out
+
+    vectorizer, version = get_tfidf_vectorizer()
+    lexical = get_lexical_index(index, vectorizer, version, backend, k1=settings.BM25_K1, b=settings.BM25_B)
+    # MaxScore pruning would keep the best rows regardless of the filters
+    lexical_top_k = (settings.LEXICAL_TOP_K or None) if allowed is None else None
+    for i, query_text in enumerate(query_texts):
+        term_ids, query_weights = lexical.query_terms(query_text, query_tfidf[i])
+        rows, scores = lexical.score(term_ids, query_weights, top_k=lexical_top_k)
+        weight = TFIDF_WEIGHT
+        if backend == 'bm25' and len(scores):
+            weight /= scores.max()
+        if allowed is not None:
+            keep, rows = _allowed_columns(rows, allowed)
+            scores = scores[keep]
+        out[i, rows] += weight * scores
+    return out
+
+def score_batch(query_texts, index, top_k, offset, filters=None):
+    """
+    Rank the corpus for several queries at once.
+
+    All queries are encoded with one TF-IDF ``transform`` and one BERT
+    ``encode`` call. The hybrid score ``0.3 * tfidf + 0.7 * bert`` is built in
+    a per-thread buffer reused across calls (see ``score_buffer``): the BERT
+    product is written into it and the sparse lexical scores are added in
+    place, so the dense scores need no fresh float matrix. What is still
+    allocated per call: the sparse lexical product, sized by the rows sharing
+    a term with each query; one corpus-length index array per query for
+    top-k selection; and, for a filtered exact query, a copy of the allowed
+    rows' BERT vectors.
+
+    ``filters`` (see ``filters.parse_filters``) restrict ranking to the rows
+    allowed by the precomputed filter masks; only those rows are scored.
 
-def process_query(query_text):
+    Returns:
+        list: One ``(rows, scores)`` pair of arrays per query, in input order,
+        holding the ranked index rows and their combined scores.
+    """
+    allowed = get_filter_index(index).allowed_rows(filters) if filters else None
+    if allowed is not None and not len(allowed):
+        return [(np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32)) for _ in query_texts]
+
+    query_tfidf = generate_tfidf_embeddings(query_texts)
+    query_bert = generate_bert_embeddings(query_texts)
+    tfidf_embeddings = index.tfidf_matrix
+    bert_embeddings = index.bert_matrix
+
+    # Ensure the embeddings are not empty and have compatible dimensions
+    if query_tfidf.shape[1] == 0 or tfidf_embeddings.shape[0] == 0:
+        raise ValueError("TF-IDF embeddings are empty.")
+    if query_bert.size == 0 or bert_embeddings.size == 0:
+        raise ValueError("BERT embeddings are empty.")
+    if query_tfidf.shape[1] != tfidf_embeddings.shape[1]:
+        raise ValueError(f"Incompatible dimension for TF-IDF embeddings: query_tfidf.shape[1] = {query_tfidf.shape[1]}, tfidf_embeddings.shape[1] = {tfidf_embeddings.shape[1]}")
+    if query_bert.shape[1] != bert_embeddings.shape[1]:
+        raise ValueError(f"Incompatible dimension for BERT embeddings: query_bert.shape[1] = {query_bert.shape[1]}, bert_embeddings.shape[1] = {bert_embeddings.shape[1]}")
+
+    # Both stacks are fresh copies of the cached rows, so normalize them in place
+    normalize_sparse_rows(query_tfidf)
+    normalize_dense_rows(query_bert)
+    query_bert *= BERT_WEIGHT
+
+    n_columns = len(index) if allowed is None else len(allowed)
+    combined_similarities = score_buffer(len(query_texts), n_columns)
+    probed = score_bert(query_bert, index, combined_similarities, allowed=allowed, min_candidates=top_k + offset)
+    score_tfidf(query_texts, query_tfidf, index, combined_similarities, allowed=allowed)
+
+    candidates = None
+    if settings.BERT_RERANK_CANDIDATES > 0 and not isinstance(bert_embeddings, np.ndarray):
+        n_candidates = max(settings.BERT_RERANK_CANDIDATES, top_k + offset)
+        candidates = rerank_bert(query_bert, index, combined_similarities, n_candidates, probed, allowed)
+
+    ranked = []
+    for i, scores in enumerate(combined_similarities):
+        if candidates is None:
+            ranked_columns = select_top_k(scores, top_k, offset)
+        else:
+            columns = candidates[i]
+            ranked_columns = columns[select_top_k(scores[columns], top_k, offset)]
+        ranked_indices = ranked_columns if allowed is None else allowed[ranked_columns]
+        # Fancy indexing copies the scores out of the reused buffer
+        ranked.append((ranked_indices, scores[ranked_columns]))
+    return ranked
+
+def assemble_results(index, rows, scores):
+    """Build the result dicts of ranked ``rows`` from the in-memory metadata projection (no queries)."""
+    results = []
+    for row, similarity_score in zip(rows.tolist(), scores.tolist()):
+        metadata = index.metadata[row]
+        if metadata:
+            results.append({**metadata, 'similarity_score': similarity_score})
+        else:
+            logger.warning(f"Metadata not found for dataset ID {index.dataset_ids[row]}")
+    return results
+
+def rank_batch(query_texts, index, top_k, offset, filters=None):
+    """Return one list of result dicts per query, in input order (see ``score_batch``)."""
+    return [assemble_results(index, rows, scores)
+            for rows, scores in score_batch(query_texts, index, top_k, offset, filters)]
+
+def process_queries(query_texts, top_k=None, offset=0, filters=None, log=True):
+    """
+    Return ranked results for every query in ``query_texts``, in order.
+
+    ``filters`` is the normalized filter dict from ``filters.parse_filters``.
+    Unless ``log`` is false, every query is queued for ``Query``/``QueryResult``
+    logging with the batch's latency split evenly between its queries.
+
+    Queries with a cached response are answered from the result cache; the
+    rest are ranked together in chunks of ``QUERY_BATCH_CHUNK_SIZE`` so the
+    ``(queries x corpus)`` score matrix stays bounded.
+    """
+    if top_k is None:
+        top_k = settings.QUERY_DEFAULT_TOP_K
+    started = time.perf_counter()
     try:
-        # Fetch embeddings from the database using Django ORM
-        embeddings = Embedding.objects.all().values('dataset_id', 'tfidf_embedding', 'bert_embedding')
-
-        # Create a DataFrame from the queryset
-        df = pd.DataFrame(list(embeddings))
-
-        # Convert embeddings from lists to numpy arrays
-        tfidf_embeddings = np.array([
-            np.array(embedding, dtype=np.float32)
-            for embedding in df['tfidf_embedding']
-        ])
-        bert_embeddings = np.array([
-            np.array(embedding, dtype=np.float32)
-            for embedding in df['bert_embedding']
-        ])
-
-        query_tfidf = generate_tfidf_embedding(query_text)
-        query_bert = generate_bert_embedding(query_text)
-
-        # Ensure the embeddings are not empty and have compatible dimensions
-        if query_tfidf.size == 0 or tfidf_embeddings.size == 0:
-            raise ValueError("TF-IDF embeddings are empty.")
-        if query_bert.size == 0 or bert_embeddings.size == 0:
-            raise ValueError("BERT embeddings are empty.")
-        if query_tfidf.shape[1] != tfidf_embeddings.shape[1]:
-            raise ValueError(f"Incompatible dimension for TF-IDF embeddings: query_tfidf.shape[1] = {query_tfidf.shape[1]}, tfidf_embeddings.shape[1] = {tfidf_embeddings.shape[1]}")
-        if query_bert.shape[1] != bert_embeddings.shape[1]:
-            raise ValueError(f"Incompatible dimension for BERT embeddings: query_bert.shape[1] = {query_bert.shape[1]}, bert_embeddings.shape[1] = {bert_embeddings.shape[1]}")
-
-        tfidf_similarities = cosine_similarity(query_tfidf, tfidf_embeddings)
-        bert_similarities = cosine_similarity(query_bert, bert_embeddings)
-
-        combined_similarities = 0.3 * tfidf_similarities + 0.7 * bert_similarities
-        ranked_indices = combined_similarities.argsort()[0][::-1]
-
-        ranked_datasets = df.iloc[ranked_indices]
-
-        # Add similarity scores to the DataFrame
-        ranked_datasets['similarity_score'] = combined_similarities[0][ranked_indices]
-
-        # Fetch metadata for the top results
-        results = []
-        for _, row in ranked_datasets.iterrows():
-            dataset_id = row['dataset_id']
-            similarity_score = row['similarity_score']
-
-            metadata = Metadata.objects.filter(id=dataset_id).first()
-            if metadata:
-                results.append({
-                    'id': metadata.id,
-                    'title': metadata.title,
-                    'description': metadata.description,
-                    'url': metadata.url,
-                    'size': metadata.size,
-                    'format': metadata.format,
-                    'similarity_score': similarity_score
-                })
-            else:
-                logger.warning(f"Metadata not found for dataset ID {dataset_id}")
+        # Reuse the resident embedding matrices instead of reloading them per query
+        index = embedding_index.get()
+
+        # Identical requests against the same index version skip scoring entirely
+        result_cache = get_result_cache()
+        version = result_cache.version()
+        cache_keys = [make_key(query_text, top_k, offset, index, version, filters) for query_text in query_texts]
+        cached = result_cache.get_many(cache_keys)
+        results = [cached.get(cache_key) for cache_key in cache_keys]
 
+        missing = [i for i, query_results in enumerate(results) if query_results is None]
+        chunk_size = settings.QUERY_BATCH_CHUNK_SIZE
+        for start in range(0, len(missing), chunk_size):
+            chunk = missing[start:start + chunk_size]
+            ranked = rank_batch([query_texts[i] for i in chunk], index, top_k, offset, filters)
+            for i, query_results in zip(chunk, ranked):
+                results[i] = query_results
+            result_cache.set_many({cache_keys[i]: results[i] for i in chunk})
+
+        if log:
+            latency_ms = (time.perf_counter() - started) * 1000 / len(query_texts)
+            for query_text, query_results in zip(query_texts, results):
+                log_query(query_text, query_results, latency_ms)
         return results
 
     except Exception as e:
         logger.error(f"Error processing query: {e}")
         raise
 
+def process_query(query_text, top_k=None, offset=0, filters=None):
+    return process_queries([query_text], top_k=top_k, offset=offset, filters=filters)[0]
+
+def stream_query(query_text, top_k, offset=0, filters=None, chunk_size=None):
+    """
+    Rank ``query_text`` now and return a generator of result chunks.
+
+    Only the ranked row ids and scores are kept; the result dicts are built
+    ``chunk_size`` at a time as the generator is consumed, so memory does not
+    grow with ``top_k``. Deep lists are not worth caching, so the result
+    cache is bypassed.
+    """
+    chunk_size = chunk_size or settings.QUERY_STREAM_CHUNK_SIZE
+    started = time.perf_counter()
+    try:
+        index = embedding_index.get()
+        (rows, scores), = score_batch([query_text], index, top_k, offset, filters)
+    except Exception as e:
+        logger.error(f"Error processing query: {e}")
+        raise
+
+    if settings.QUERY_LOGGING_ENABLED:
+        logged = settings.QUERY_LOG_MAX_RESULTS
+        log_query(query_text, assemble_results(index, rows[:logged], scores[:logged]),
+                  (time.perf_counter() - started) * 1000)
+
+    def chunks():
+        for start in range(0, len(rows), chunk_size):
+            yield assemble_results(index, rows[start:start + chunk_size], scores[start:start + chunk_size])
+
+    return chunks()
+
+def warm_up():
+    """
+    Load everything the first query would otherwise load: both encoders (with
+    one forward pass), the embedding index, the configured ANN/lexical
+    indexes and the filter masks.
+    """
+    vectorizer, version = get_tfidf_vectorizer()
+    model, _ = get_bert_model()
+    model.encode(['warmup'])
+    index = embedding_index.get()
+    get_filter_index(index)
+    if settings.BERT_SEARCH_BACKEND == 'ivf':
+        get_ann_index()
+    if settings.LEXICAL_BACKEND != 'cosine':
+        get_lexical_index(index, vectorizer, version, settings.LEXICAL_BACKEND,
+                          k1=settings.BM25_K1, b=settings.BM25_B)
+
 # if __name__ == "__main__":
 #     query_text = "Find datasets about e-commerce sales"
 #     results = process_query(query_text)
@@ -0,0 +1,273 @@
+import logging
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Rows decoded at a time when scoring, bounding the float32 scratch space
+BLOCK_ROWS = 4096
+
+
+class Float16Matrix:
+    """BERT matrix stored as float16 (half the memory of float32)."""
+
+    scheme = 'float16'
+
+    def __init__(self, codes):
+        self.codes = codes
+
+    @classmethod
+    def build(cls, matrix):
+        return cls(matrix.astype(np.float16))
+
+    @property
+    def shape(self):
+        return self.codes.shape
+
+    @property
+    def size(self):
+        return self.codes.size
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes
+
+    def decode(self, rows):
+        return self.codes[rows].astype(np.float32)
+
+    def dot(self, queries, out):
+        """Write ``queries @ decoded.T`` into ``out``, decoding ``BLOCK_ROWS`` rows at a time."""
+        for start in range(0, self.shape[0], BLOCK_ROWS):
+            block = slice(start, start + BLOCK_ROWS)
+            np.matmul(queries, self.codes[block].astype(np.float32).T, out=out[:, block])
+        return out
+
+    def dot_rows(self, query, rows):
+        return self.decode(rows) @ query
+
+
+class Int8Matrix(Float16Matrix):
+    """
+    BERT matrix stored as int8 codes with one float32 scale per row.
+
+    Row ``i`` decodes to ``codes[i] * scales[i]``, where the scale maps the
+    row's largest absolute value onto 127.
+    """
+
+    scheme = 'int8'
+
+    def __init__(self, codes, scales):
+        super().__init__(codes)
+        self.scales = scales
+
+    @classmethod
+    def build(cls, matrix):
+        scales = (np.abs(matrix).max(axis=1, initial=0.0) / 127.0).astype(np.float32)
+        safe = np.where(scales > 0, scales, 1.0)[:, np.newaxis]
+        codes = np.clip(np.rint(matrix / safe), -127, 127).astype(np.int8)
+        return cls(codes, scales)
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.scales.nbytes
+
+    def decode(self, rows):
+        return self.codes[rows].astype(np.float32) * self.scales[rows, np.newaxis]
+
+    def dot(self, queries, out):
+        for start in range(0, self.shape[0], BLOCK_ROWS):
+            block = slice(start, start + BLOCK_ROWS)
+            target = out[:, block]
+            np.matmul(queries, self.codes[block].astype(np.float32).T, out=target)
+            target *= self.scales[block]
+        return out
+
+
+def kmeans(vectors, n_clusters, n_iter=10, seed=0):
+    """Euclidean k-means; returns the ``(n_clusters, d)`` float32 centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        assignments = nearest_codewords(vectors, centroids)
+        counts = np.bincount(assignments, minlength=n_clusters)
+        sums = np.stack([np.bincount(assignments, weights=vectors[:, d], minlength=n_clusters)
+                         for d in range(vectors.shape[1])], axis=1)
+        empty = counts == 0
+        if empty.any():
+            # Re-seed empty clusters with random points so every codeword stays usable
+            sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+            counts[empty] = 1
+        centroids = (sums / counts[:, np.newaxis]).astype(np.float32)
+    return centroids
+
+
+def nearest_codewords(vectors, codewords, chunk_size=8192):
+    """Return the index of the closest (L2) codeword for every row of ``vectors``."""
+    # argmin ||x - c||^2 == argmax (x . c - ||c||^2 / 2)
+    half_norms = 0.5 * np.einsum('ij,ij->i', codewords, codewords)
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk_size):
+        chunk = vectors[start:start + chunk_size]
+        assignments[start:start + chunk_size] = np.argmax(chunk @ codewords.T - half_norms, axis=1)
+    return assignments
+
+
+class PQMatrix:
+    """
+    Product-quantized BERT matrix scored with asymmetric distance computation.
+
+    Vectors are split into ``n_subvectors`` sub-vectors; each sub-space has
+    its own codebook of up to 256 centroids and a row is stored as one uint8
+    code per sub-space. A query is kept in full precision: it is multiplied
+    with every codebook once, and a row's score is the sum of the looked-up
+    sub-space products.
+    """
+
+    scheme = 'pq'
+
+    def __init__(self, codebooks, codes):
+        self.codebooks = codebooks  # (n_subvectors, n_codewords, sub_dim)
+        self.codes = codes  # (N, n_subvectors) uint8
+
+    @classmethod
+    def build(cls, matrix, n_subvectors=48, n_codewords=256, n_iter=10, train_size=10000, seed=0):
+        n_rows, dim = matrix.shape
+        if dim % n_subvectors:
+            raise ValueError(f"BERT dimension {dim} is not divisible by {n_subvectors} PQ sub-vectors.")
+        sub_dim = dim // n_subvectors
+        n_codewords = max(1, min(n_codewords, 256, n_rows))
+
+        rng = np.random.default_rng(seed)
+        sample = matrix[rng.choice(n_rows, min(n_rows, max(train_size, n_codewords)), replace=False)]
+        codebooks = np.empty((n_subvectors, n_codewords, sub_dim), dtype=np.float32)
+        codes = np.empty((n_rows, n_subvectors), dtype=np.uint8)
+        for j in range(n_subvectors):
+            columns = slice(j * sub_dim, (j + 1) * sub_dim)
+            codebooks[j] = kmeans(np.ascontiguousarray(sample[:, columns]), n_codewords, n_iter=n_iter, seed=seed + j)
+            codes[:, j] = nearest_codewords(np.ascontiguousarray(matrix[:, columns]), codebooks[j])
+        return cls(codebooks, codes)
+
+    @property
+    def shape(self):
+        return (self.codes.shape[0], self.codebooks.shape[0] * self.codebooks.shape[2])
+
+    @property
+    def size(self):
+        return self.shape[0] * self.shape[1]
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.codebooks.nbytes
+
+    def _tables(self, queries):
+        # (Q, n_subvectors, n_codewords): query sub-vector . codeword
+        n_subvectors, _, sub_dim = self.codebooks.shape
+        return np.einsum('qmd,mkd->qmk', queries.reshape(len(queries), n_subvectors, sub_dim), self.codebooks)
+
+    def decode(self, rows):
+        codes = self.codes[rows]
+        parts = self.codebooks[np.arange(self.codebooks.shape[0]), codes]
+        return parts.reshape(len(codes), -1)
+
+    def dot(self, queries, out):
+        tables = self._tables(queries)
+        for start in range(0, self.shape[0], BLOCK_ROWS):
+            block = slice(start, start + BLOCK_ROWS)
+            target = out[:, block]
+            target.fill(0.0)
+            for j, column in enumerate(self.codes[block].T):
+                target += tables[:, j, column]
+        return out
+
+    def dot_rows(self, query, rows):
+        table = self._tables(query[np.newaxis])[0]
+        return table[np.arange(table.shape[0]), self.codes[rows]].sum(axis=1)
+
+
+def quantize(matrix, scheme, pq_subvectors=48, pq_codewords=256):
+    """
+    Return ``matrix`` (L2-normalized float32 rows) in the representation named by ``scheme``.
+
+    ``'none'`` returns the matrix unchanged; ``'float16'``, ``'int8'`` and
+    ``'pq'`` return a compressed matrix exposing ``dot``/``dot_rows``/``decode``.
+    """
+    if scheme == 'none':
+        return matrix
+    started = time.perf_counter()
+    if scheme == 'float16':
+        quantized = Float16Matrix.build(matrix)
+    elif scheme == 'int8':
+        quantized = Int8Matrix.build(matrix)
+    elif scheme == 'pq':
+        quantized = PQMatrix.build(matrix, n_subvectors=pq_subvectors, n_codewords=pq_codewords)
+    else:
+        raise ValueError(f"Unknown BERT_QUANTIZATION '{scheme}'")
+    logger.info(f"Quantized {len(matrix)} BERT vectors to {scheme} "
+                f"({matrix.nbytes / 2 ** 20:.1f} MB -> {quantized.nbytes / 2 ** 20:.1f} MB) "
+                f"in {time.perf_counter() - started:.2f}s")
+    return quantized
+
+
+def evaluate_quantization(vectors, schemes, k=10, rerank=0, n_queries=200, seed=0,
+                          pq_subvectors=48, pq_codewords=256):
+    """
+    Compare quantized BERT search against exact float32 search.
+
+    ``vectors`` must be L2-normalized. Sampled corpus rows are used as
+    queries with themselves excluded. For every scheme the report holds the
+    memory used, recall@k of the quantized scores and, when ``rerank`` is
+    set, recall@k after re-scoring the best ``rerank`` candidates in full
+    precision, plus the latency of each.
+    """
+    rng = np.random.default_rng(seed)
+    query_rows = rng.choice(len(vectors), min(n_queries, len(vectors)), replace=False)
+    queries = vectors[query_rows]
+    k = min(k, len(vectors) - 1)
+
+    def top(scores, count):
+        scores[np.arange(len(query_rows)), query_rows] = -np.inf
+        count = min(count, scores.shape[1] - 1)
+        best = np.argpartition(-scores, count - 1, axis=1)[:, :count]
+        order = np.argsort(-np.take_along_axis(scores, best, axis=1), axis=1, kind='stable')
+        return np.take_along_axis(best, order, axis=1)
+
+    exact = top(queries @ vectors.T, k)
+    report = []
+    for scheme in schemes:
+        started = time.perf_counter()
+        quantized = quantize(vectors, scheme, pq_subvectors=pq_subvectors, pq_codewords=pq_codewords)
+        build_seconds = time.perf_counter() - started
+
+        scores = np.empty((len(queries), len(vectors)), dtype=np.float32)
+        started = time.perf_counter()
+        if scheme == 'none':
+            np.matmul(queries, vectors.T, out=scores)
+        else:
+            quantized.dot(queries, scores)
+        approx = top(scores, max(k, rerank))
+        latency_ms = (time.perf_counter() - started) * 1000 / len(queries)
+
+        row = {
+            'scheme': scheme,
+            'bytes': quantized.nbytes,
+            'compression': vectors.nbytes / quantized.nbytes,
+            'build_seconds': build_seconds,
+            'recall': _recall(exact, approx[:, :k]),
+            'latency_ms': latency_ms,
+        }
+        if rerank:
+            started = time.perf_counter()
+            reranked = np.empty_like(exact)
+            for i, candidates in enumerate(approx):
+                full = vectors[candidates] @ queries[i]
+                reranked[i] = candidates[np.argsort(-full, kind='stable')[:k]]
+            row['reranked_recall'] = _recall(exact, reranked)
+            row['rerank_ms'] = (time.perf_counter() - started) * 1000 / len(queries)
+        report.append(row)
+    return report
+
+
+def _recall(exact, found):
+    hits = sum(len(set(a.tolist()).intersection(b.tolist())) for a, b in zip(exact, found))
+    return hits / exact.size
@@ -0,0 +1,196 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Queued by flush() to make the worker write what it holds and exit
+_STOP = object()
+
+
+class QueryLogWriter:
+    """
+    Persist searches as ``Query``/``QueryResult`` rows off the request path.
+
+    ``log`` only puts an entry on a bounded in-process queue and never raises;
+    when the queue is full the entry is dropped and counted. A daemon thread
+    collects entries until ``flush_items`` are waiting or ``flush_ms`` have
+    passed since the first one, then writes them with two ``bulk_create``
+    calls in one transaction, skipping results whose dataset has been
+    deleted since. Failed flushes are logged and dropped.
+    """
+
+    def __init__(self, flush_items=100, flush_ms=1000.0, max_queue=10000, max_results=20):
+        self.flush_items = flush_items
+        self.flush_interval = flush_ms / 1000.0
+        self.max_results = max_results
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._counter_lock = threading.Lock()
+        self._worker = None
+        self.logged = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed_flushes = 0
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            with self._lock:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = threading.Thread(target=self._run, name='query-log-writer', daemon=True)
+                    self._worker.start()
+
+    def log(self, query_text, results, latency_ms):
+        """
+        Queue one search for persistence.
+
+        ``results`` are the ranked result dicts (``id`` and
+        ``similarity_score``); only the first ``max_results`` are kept.
+        """
+        try:
+            entry = (
+                query_text,
+                [(result['id'], result['similarity_score']) for result in results[:self.max_results]],
+                latency_ms,
+            )
+            self._ensure_worker()
+            self._queue.put_nowait(entry)
+            self._count('logged')
+        except queue.Full:
+            self._count('dropped')
+        except Exception as e:
+            self._count('dropped')
+            logger.warning(f"Could not queue query log entry: {e}")
+
+    def _count(self, counter, n=1):
+        with self._counter_lock:
+            setattr(self, counter, getattr(self, counter) + n)
+
+    def _collect(self):
+        """Return ``(batch, stop)``; ``stop`` is set once ``flush`` asked the worker to exit."""
+        entry = self._queue.get()
+        if entry is _STOP:
+            return [], True
+        batch = [entry]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.flush_items:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if entry is _STOP:
+                return batch, True
+            batch.append(entry)
+        return batch, False
+
+    def _run(self):
+        while True:
+            batch, stop = self._collect()
+            if batch:
+                self._write(batch)
+            if stop:
+                return
+
+    def _write(self, batch):
+        from django.db import close_old_connections, transaction
+
+        from recommendations.models import Metadata, Query, QueryResult
+
+        with self._flush_lock:
+            # This thread keeps its own connection; drop it if it went stale
+            close_old_connections()
+            try:
+                with transaction.atomic():
+                    # One deleted dataset must not fail the foreign key check for the whole batch
+                    dataset_ids = {dataset_id for _, ranked, _ in batch for dataset_id, _ in ranked}
+                    existing = set(Metadata.objects.filter(id__in=dataset_ids).values_list('id', flat=True))
+                    queries = Query.objects.bulk_create(
+                        [Query(query_text=text, latency_ms=latency_ms) for text, _, latency_ms in batch]
+                    )
+                    QueryResult.objects.bulk_create([
+                        QueryResult(query_id=query.pk, dataset_id=dataset_id, rank=rank, score=score)
+                        for query, (_, ranked, _) in zip(queries, batch)
+                        for rank, (dataset_id, score) in enumerate(ranked, start=1)
+                        if dataset_id in existing
+                    ])
+                self._count('written', len(batch))
+            except Exception as e:
+                self._count('failed_flushes')
+                logger.error(f"Dropped {len(batch)} query log entries: {e}")
+
+    def flush(self, timeout=5.0):
+        """
+        Write every queued entry (used at shutdown).
+
+        The worker is asked to write the batch it is collecting and exit, then
+        whatever it left in the queue is written from the calling thread.
+        """
+        worker = self._worker
+        if worker is not None and worker.is_alive():
+            try:
+                self._queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                pass
+            else:
+                worker.join(timeout)
+
+        batch = []
+        while True:
+            try:
+                entry = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is not _STOP:
+                batch.append(entry)
+            if len(batch) >= self.flush_items:
+                self._write(batch)
+                batch = []
+        if batch:
+            self._write(batch)
+
+    def stats(self):
+        return {
+            'logged': self.logged,
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed_flushes': self.failed_flushes,
+            'queued': self._queue.qsize(),
+        }
+
+
+_lock = threading.Lock()
+_writer = None
+
+
+def get_query_log_writer():
+    """Return the process-wide query log writer configured by ``QUERY_LOG_*``."""
+    global _writer
+    if _writer is None:
+        with _lock:
+            if _writer is None:
+                _writer = QueryLogWriter(
+                    flush_items=settings.QUERY_LOG_FLUSH_ITEMS,
+                    flush_ms=settings.QUERY_LOG_FLUSH_MS,
+                    max_queue=settings.QUERY_LOG_MAX_QUEUE,
+                    max_results=settings.QUERY_LOG_MAX_RESULTS,
+                )
+                atexit.register(_writer.flush)
+    return _writer
+
+
+def log_query(query_text, results, latency_ms):
+    """Queue a search for logging when ``QUERY_LOGGING_ENABLED``; never raises."""
+    if not settings.QUERY_LOGGING_ENABLED:
+        return
+    try:
+        get_query_log_writer().log(query_text, results, latency_ms)
+    except Exception as e:
+        logger.warning(f"Query logging failed: {e}")
@@ -0,0 +1,31 @@
+import numpy as np
+
+
+def select_top_k(scores, top_k, offset=0):
+    """
+    Return the row indices of the best ``top_k`` scores after skipping ``offset``.
+
+    Uses ``np.argpartition`` on ``scores`` itself (no negated copy) to isolate
+    the ``offset + top_k`` best rows and only sorts those, so the cost is
+    O(n + k log k) instead of a full argsort.
+
+    Args:
+        scores (numpy.ndarray): 1-D array of similarity scores.
+        top_k (int): Number of results to return.
+        offset (int): Number of best results to skip (for pagination).
+
+    Returns:
+        numpy.ndarray: Row indices ordered from best to worst.
+    """
+    n = scores.shape[0]
+    stop = min(offset + top_k, n)
+    if top_k <= 0 or offset >= n:
+        return np.empty(0, dtype=np.intp)
+
+    if stop < n:
+        # The best ``stop`` rows end up after position n - stop; sorting them restores row order
+        candidates = np.sort(np.argpartition(scores, n - stop)[n - stop:])
+    else:
+        candidates = np.arange(n)
+    ordered = candidates[np.argsort(-scores[candidates], kind='stable')]
+    return ordered[offset:stop]
@@ -0,0 +1,111 @@
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_state = {'status': 'idle', 'error': None, 'seconds': None, 'prewarm': None}
+_lock = threading.Lock()
+_warmup_thread = None
+
+
+def _reset_after_fork():
+    """
+    Forget a warmup the parent was still running: its thread does not exist in
+    the child, so the child starts its own. A finished warmup is kept, since
+    the child inherits everything it loaded.
+    """
+    global _lock, _warmup_thread
+    _lock = threading.Lock()
+    if _state['status'] == 'warming':
+        _state.update(status='idle', error=None, seconds=None, prewarm=None)
+        _warmup_thread = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def run_warmup():
+    """
+    Load encoders and indexes in this thread; safe to call more than once.
+
+    With ``QUERY_PREWARM_ON_STARTUP`` the caches are then filled from the
+    query logs before the process reports ready; a failed pre-warm is logged
+    but does not keep the process from serving.
+    """
+    # Imported here so importing this module stays cheap for management commands
+    from recommendations.query_processing.process_query import warm_up
+
+    with _lock:
+        if _state['status'] in ('warming', 'ready'):
+            return
+        _state['status'] = 'warming'
+
+    started = time.perf_counter()
+    try:
+        warm_up()
+    except Exception as e:
+        logger.error(f"Query warmup failed: {e}")
+        _state.update(status='failed', error=str(e))
+        return
+
+    if settings.QUERY_PREWARM_ON_STARTUP:
+        from recommendations.query_processing.prewarm import prewarm_caches
+
+        try:
+            _state['prewarm'] = prewarm_caches()
+        except Exception as e:
+            logger.error(f"Query cache pre-warm failed: {e}")
+            _state['prewarm'] = {'error': str(e)}
+    _state.update(status='ready', error=None, seconds=round(time.perf_counter() - started, 3))
+    logger.info(f"Query processing warmed up in {_state['seconds']}s")
+
+
+def start_background_warmup():
+    """
+    Start ``run_warmup`` on a daemon thread when ``QUERY_WARMUP_ON_STARTUP`` is set.
+
+    Only the first call in a process starts a thread. It is called from the
+    first ``readiness()`` check rather than at import, so with a preloading
+    server (``gunicorn --preload``) each forked worker warms itself up.
+    """
+    global _warmup_thread
+    if not settings.QUERY_WARMUP_ON_STARTUP:
+        return None
+    with _lock:
+        if _warmup_thread is None:
+            _warmup_thread = threading.Thread(target=run_warmup, name='query-warmup', daemon=True)
+            _warmup_thread.start()
+    return _warmup_thread
+
+
+def readiness():
+    """
+    Describe whether this process can serve queries without loading anything.
+
+    ``ready`` is true once warmup (including any pre-warm) finished, or once
+    both encoders and the embedding index have been loaded by earlier
+    requests while no warmup is running. The first call starts the
+    background warmup.
+    """
+    from recommendations.query_processing.batching import get_encode_batcher
+    from recommendations.query_processing.embedding_index import embedding_index
+    from recommendations.query_processing.encoders import encoders_loaded, query_embedding_cache
+    from recommendations.query_processing.query_log import get_query_log_writer
+    from recommendations.query_processing.result_cache import get_result_cache
+
+    start_background_warmup()
+    components = encoders_loaded()
+    components['embedding_index'] = embedding_index.is_loaded
+    return {
+        'ready': _state['status'] == 'ready' or (_state['status'] != 'warming' and all(components.values())),
+        'warmup': dict(_state),
+        'components': components,
+        'query_embedding_cache': query_embedding_cache.stats(),
+        'result_cache': get_result_cache().stats(),
+        'encode_batcher': get_encode_batcher().stats() if settings.QUERY_BATCHING_ENABLED else None,
+        'query_log': get_query_log_writer().stats() if settings.QUERY_LOGGING_ENABLED else None,
+    }
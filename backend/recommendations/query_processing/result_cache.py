@@ -0,0 +1,146 @@
+import hashlib
+import json
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+
+from recommendations.query_processing.query_cache import LRUCache, normalize_query
+
+VERSION_KEY = 'recommendations:query-results:version'
+KEY_PREFIX = 'recommendations:query-results:'
+
+
+class LocalResultCache:
+    """Per-process result cache backed by ``LRUCache``."""
+
+    def __init__(self, maxsize, ttl):
+        self._entries = LRUCache(maxsize, ttl=ttl)
+        self._version = 0
+
+    def get(self, key):
+        return self._entries.get(key)
+
+    def set(self, key, results):
+        self._entries.set(key, results)
+
+    def get_many(self, keys):
+        found = {}
+        for key in keys:
+            results = self._entries.get(key)
+            if results is not None:
+                found[key] = results
+        return found
+
+    def set_many(self, entries):
+        for key, results in entries.items():
+            self._entries.set(key, results)
+
+    def version(self):
+        return self._version
+
+    def bump_version(self):
+        # Old keys can no longer be produced; drop them instead of waiting for eviction
+        self._version += 1
+        self._entries.clear()
+
+    def stats(self):
+        return self._entries.stats()
+
+
+class DjangoResultCache:
+    """Result cache stored in a Django cache alias, shared by every process using it."""
+
+    def __init__(self, alias, ttl):
+        self._cache = caches[alias]
+        self._ttl = ttl or None
+
+    def get(self, key):
+        return self._cache.get(KEY_PREFIX + key)
+
+    def set(self, key, results):
+        self._cache.set(KEY_PREFIX + key, results, self._ttl)
+
+    def get_many(self, keys):
+        # One round trip for the whole batch on networked backends
+        found = self._cache.get_many([KEY_PREFIX + key for key in keys])
+        return {key[len(KEY_PREFIX):]: results for key, results in found.items()}
+
+    def set_many(self, entries):
+        self._cache.set_many({KEY_PREFIX + key: results for key, results in entries.items()}, self._ttl)
+
+    def version(self):
+        return self._cache.get_or_set(VERSION_KEY, 0, None)
+
+    def bump_version(self):
+        try:
+            self._cache.incr(VERSION_KEY)
+        except ValueError:
+            self._cache.set(VERSION_KEY, 1, None)
+
+    def stats(self):
+        return {'backend': 'django', 'alias': settings.QUERY_RESULT_CACHE_ALIAS}
+
+
+class NullResultCache:
+    def get(self, key):
+        return None
+
+    def set(self, key, results):
+        pass
+
+    def get_many(self, keys):
+        return {}
+
+    def set_many(self, entries):
+        pass
+
+    def version(self):
+        return 0
+
+    def bump_version(self):
+        pass
+
+    def stats(self):
+        return {'backend': 'none'}
+
+
+_lock = threading.Lock()
+_result_cache = None
+
+
+def get_result_cache():
+    """Return the result cache selected by ``QUERY_RESULT_CACHE_BACKEND``."""
+    global _result_cache
+    if _result_cache is None:
+        with _lock:
+            if _result_cache is None:
+                backend = settings.QUERY_RESULT_CACHE_BACKEND
+                if backend == 'locmem':
+                    _result_cache = LocalResultCache(settings.QUERY_RESULT_CACHE_SIZE,
+                                                     settings.QUERY_RESULT_CACHE_TTL)
+                elif backend == 'django':
+                    _result_cache = DjangoResultCache(settings.QUERY_RESULT_CACHE_ALIAS,
+                                                      settings.QUERY_RESULT_CACHE_TTL)
+                elif backend == 'none':
+                    _result_cache = NullResultCache()
+                else:
+                    raise ValueError(f"Unknown QUERY_RESULT_CACHE_BACKEND '{backend}'")
+    return _result_cache
+
+
+def make_key(query_text, top_k, offset, index, version, filters=None):
+    """
+    Build the cache key for one ranked response.
+
+    The key covers the normalized query, the page requested, the filters and
+    the index version: ``version``, the cache's version counter (bumped on
+    every Metadata/Embedding change, read once per request), plus the loaded
+    index's table watermark, so a process never serves results computed from
+    other data.
+    """
+    payload = json.dumps(
+        [normalize_query(query_text), top_k, offset, filters or {}, version, str(index.watermark)],
+        sort_keys=True,
+    )
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
@@ -0,0 +1,166 @@
+"""
+Flat-file snapshot of the embedding index, opened with ``np.memmap``.
+
+Layout::
+
+    MAGIC (8 bytes) | header length (uint64 LE) | JSON header | arrays...
+
+The header records the format version, the index version (the Embedding /
+Metadata watermark the snapshot was taken at), the row count and vector
+dimensions, a SHA-256 checksum of everything after the header, and the
+dtype, shape and offset of every array. Arrays start on ``ALIGNMENT`` byte
+boundaries so they can be viewed in place: every process mapping the file
+shares one page-cached copy, and opening it does not touch the database.
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'EDMSNAP1'
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _padding(length):
+    return -length % ALIGNMENT
+
+
+def _json_bytes(value):
+    return np.frombuffer(json.dumps(value).encode('utf-8'), dtype=np.uint8)
+
+
+def _snapshot_arrays(data):
+    if not isinstance(data.bert_matrix, np.ndarray):
+        raise SnapshotError("Snapshots store the full-precision BERT matrix; load the index unquantized.")
+    arrays = {
+        'dataset_ids': data.dataset_ids,
+        'bert_matrix': data.bert_matrix,
+        'bert_norms': data.bert_norms,
+        'tfidf_indptr': data.tfidf_matrix.indptr,
+        'tfidf_indices': data.tfidf_matrix.indices,
+        'tfidf_data': data.tfidf_matrix.data,
+        'tfidf_norms': data.tfidf_norms,
+        'tfidf_t_indptr': data.tfidf_matrix_t.indptr,
+        'tfidf_t_indices': data.tfidf_matrix_t.indices,
+        'tfidf_t_data': data.tfidf_matrix_t.data,
+        'metadata': _json_bytes(data.metadata),
+    }
+    if data.texts is not None:
+        arrays['texts'] = _json_bytes(data.texts)
+    return {name: np.ascontiguousarray(array) for name, array in arrays.items() if array is not None}
+
+
+def write_snapshot(path, data):
+    """
+    Write ``data`` (an unquantized ``IndexData``) to ``path`` and return its header.
+
+    The file is written next to ``path`` and moved into place atomically, so
+    processes that still map the previous snapshot keep a consistent view.
+    """
+    arrays = _snapshot_arrays(data)
+    specs = {}
+    checksum = hashlib.sha256()
+    offset = 0
+    for name, array in arrays.items():
+        specs[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        checksum.update(memoryview(array).cast('B'))
+        padding = _padding(array.nbytes)
+        checksum.update(b'\0' * padding)
+        offset += array.nbytes + padding
+
+    header = {
+        'format_version': FORMAT_VERSION,
+        'index_version': str(data.watermark),
+        'created_at': time.time(),
+        'n_rows': len(data),
+        'bert_dim': data.bert_matrix.shape[1],
+        'tfidf_dim': data.tfidf_matrix.shape[1],
+        'payload_bytes': offset,
+        'checksum': checksum.hexdigest(),
+        'arrays': specs,
+    }
+    header_bytes = json.dumps(header).encode('utf-8')
+    header_bytes += b' ' * _padding(len(MAGIC) + 8 + len(header_bytes))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(np.uint64(len(header_bytes)).astype('<u8').tobytes())
+        f.write(header_bytes)
+        for array in arrays.values():
+            f.write(memoryview(array).cast('B'))
+            f.write(b'\0' * _padding(array.nbytes))
+    os.replace(tmp_path, path)
+    return header
+
+
+def read_header(path):
+    """Return ``(header, payload_offset)`` for the snapshot at ``path``."""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise SnapshotError(f"{path} is not an embedding index snapshot.")
+        header_length = int(np.frombuffer(f.read(8), dtype='<u8')[0])
+        header = json.loads(f.read(header_length))
+    if header['format_version'] != FORMAT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot format {header['format_version']} in {path}.")
+    return header, len(MAGIC) + 8 + header_length
+
+
+def open_snapshot(path, watermark, load_texts=False, verify=False):
+    """
+    Map the snapshot at ``path`` and return it as an ``IndexData``.
+
+    The arrays are read-only views of one shared ``np.memmap``; only the
+    metadata projection (and the texts, when ``load_texts``) are parsed into
+    process memory. ``verify`` recomputes the checksum, which reads the
+    whole file once.
+    """
+    from scipy import sparse
+
+    from recommendations.query_processing.embedding_index import IndexData
+
+    started = time.perf_counter()
+    header, payload_offset = read_header(path)
+    buffer = np.memmap(path, dtype=np.uint8, mode='r')
+    if len(buffer) != payload_offset + header['payload_bytes']:
+        raise SnapshotError(f"{path} is truncated.")
+    if verify and hashlib.sha256(buffer[payload_offset:]).hexdigest() != header['checksum']:
+        raise SnapshotError(f"Checksum mismatch in {path}.")
+
+    specs = header['arrays']
+    if load_texts and 'texts' not in specs:
+        raise SnapshotError(f"{path} was written with --no-texts; BM25 scoring needs the texts.")
+
+    def array(name):
+        spec = specs[name]
+        return np.ndarray(tuple(spec['shape']), dtype=np.dtype(spec['dtype']), buffer=buffer,
+                          offset=payload_offset + spec['offset'])
+
+    def json_array(name):
+        return json.loads(array(name).tobytes().decode('utf-8'))
+
+    n_rows, tfidf_dim = header['n_rows'], header['tfidf_dim']
+    tfidf_matrix = sparse.csr_matrix(
+        (array('tfidf_data'), array('tfidf_indices'), array('tfidf_indptr')), shape=(n_rows, tfidf_dim))
+    tfidf_matrix_t = sparse.csr_matrix(
+        (array('tfidf_t_data'), array('tfidf_t_indices'), array('tfidf_t_indptr')), shape=(tfidf_dim, n_rows))
+
+    data = IndexData(
+        array('dataset_ids'), tfidf_matrix, array('bert_matrix'), json_array('metadata'), watermark,
+        texts=json_array('texts') if load_texts else None,
+        tfidf_norms=array('tfidf_norms'), bert_norms=array('bert_norms'),
+        tfidf_matrix_t=tfidf_matrix_t,
+    )
+    logger.info(f"Mapped embedding index snapshot {path} ({n_rows} rows, "
+                f"index version {header['index_version']}) in {time.perf_counter() - started:.2f}s")
+    return data
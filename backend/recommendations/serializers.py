@@ -1,15 +1,89 @@
+import numpy as np
 from rest_framework import serializers
+from rest_framework.validators import UniqueValidator
+from .embedding_codec import DEFAULT_DTYPE, decode_dense, decode_sparse, encode_dense, encode_sparse
 from .models import Metadata, Embedding, Query, QueryResult
 
+
+def stored_vectors(embedding):
+    """Return the object holding ``embedding``'s vector columns: its shared ``EmbeddingVector`` or itself."""
+    return embedding.vector if embedding.vector_id else embedding
+
+
+class TfidfEmbeddingField(serializers.Field):
+    """
+    Exposes the binary TF-IDF columns as ``{'indices', 'values', 'dim'}``.
+
+    Accepts the same sparse form, or a dense list, on input.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        vectors = stored_vectors(instance)
+        indices, values = decode_sparse(vectors.tfidf_indices, vectors.tfidf_values, vectors.vector_dtype)
+        return {'indices': indices.tolist(), 'values': values.tolist(), 'dim': vectors.tfidf_dim}
+
+    def to_internal_value(self, data):
+        try:
+            if isinstance(data, dict):
+                indices = np.asarray(data['indices'], dtype=np.int32)
+                values = np.asarray(data['values'], dtype=np.float32)
+                dim = int(data['dim'])
+            else:
+                dense = np.asarray(data, dtype=np.float32)
+                if dense.ndim != 1:
+                    raise ValueError
+                indices = np.flatnonzero(dense)
+                values = dense[indices]
+                dim = dense.shape[0]
+            tfidf_indices, tfidf_values = encode_sparse(indices, values)
+        except (KeyError, TypeError, ValueError):
+            raise serializers.ValidationError("Expected a list of floats or {'indices', 'values', 'dim'}.")
+        return {'tfidf_indices': tfidf_indices, 'tfidf_values': tfidf_values, 'tfidf_dim': dim}
+
+
+class BertEmbeddingField(serializers.Field):
+    """Exposes the binary BERT column as a list of floats."""
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        vectors = stored_vectors(instance)
+        return decode_dense(vectors.bert_vector, vectors.vector_dtype).tolist()
+
+    def to_internal_value(self, data):
+        try:
+            vector = np.asarray(data, dtype=np.float32)
+        except (TypeError, ValueError):
+            vector = None
+        if vector is None or vector.ndim != 1:
+            raise serializers.ValidationError("Expected a list of floats.")
+        bert_vector, bert_dim = encode_dense(vector)
+        return {'bert_vector': bert_vector, 'bert_dim': bert_dim, 'vector_dtype': DEFAULT_DTYPE}
+
+
 class MetadataSerializer(serializers.ModelSerializer):
     class Meta:
         model = Metadata
         fields = '__all__'
 
 class EmbeddingSerializer(serializers.ModelSerializer):
+    tfidf_embedding = TfidfEmbeddingField()
+    bert_embedding = BertEmbeddingField()
+
     class Meta:
         model = Embedding
-        fields = '__all__'
+        fields = ['id', 'dataset', 'tfidf_embedding', 'bert_embedding', 'combined_normalized_text', 'created_at', 'updated_at']
+        # Mirrors the unique_embedding_per_dataset constraint, so duplicates are a 400 rather than an IntegrityError
+        extra_kwargs = {
+            'dataset': {'validators': [UniqueValidator(queryset=Embedding.objects.all(),
+                                                       message="This dataset already has an embedding.")]},
+        }
 
 class QuerySerializer(serializers.ModelSerializer):
     class Meta:
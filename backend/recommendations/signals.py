@@ -0,0 +1,15 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Embedding, Metadata
+from .query_processing.embedding_index import embedding_index
+from .query_processing.result_cache import get_result_cache
+
+
+@receiver(post_save, sender=Embedding)
+@receiver(post_delete, sender=Embedding)
+@receiver(post_save, sender=Metadata)
+@receiver(post_delete, sender=Metadata)
+def invalidate_search_state(sender, **kwargs):
+    embedding_index.invalidate()
+    get_result_cache().bump_version()
@@ -1,3 +1,946 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import tempfile
+import threading
+from unittest import mock
 
-# Create your tests here.
+import joblib
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from .embedding_codec import decode_dense, decode_sparse, encode_dense, encode_sparse
+from .models import Embedding, EmbeddingVector, Metadata, Query, QueryResult
+from .query_processing import encoders, executor, readiness
+from .query_processing.ann_index import IVFIndex
+from .query_processing.batching import EncodeBatcher
+from .query_processing.embedding_index import (
+    EmbeddingIndex, IndexData, embedding_index, load_bert_rows, normalize_dense_rows,
+)
+from .query_processing.filters import FilterIndex, format_values, normalize_value, parse_filters, size_bucket
+from .query_processing.lexical_index import InvertedIndex
+from .query_processing.prewarm import popular_queries, prewarm_caches
+from .query_processing.process_query import process_queries, process_query, rank_batch, rerank_bert
+from .query_processing.quantization import Float16Matrix, Int8Matrix, PQMatrix, evaluate_quantization
+from .query_processing.query_cache import LRUCache
+from .query_processing.query_log import QueryLogWriter
+from .query_processing.ranking import select_top_k
+from .query_processing.result_cache import DjangoResultCache, get_result_cache
+from .query_processing.snapshot import SnapshotError, open_snapshot, write_snapshot
+from .views import parse_pagination
+
+WORDS = ['sales', 'orders', 'stock', 'prices', 'weather', 'climate', 'football', 'scores', 'covid',
+         'cases', 'housing', 'rent', 'movies', 'ratings', 'flights', 'delays', 'crime', 'city']
+
+
+def random_texts(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return [' '.join(rng.choice(WORDS, rng.integers(2, 12))) for _ in range(n)]
+
+
+def unit_rows(n, dim, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+    normalize_dense_rows(vectors)
+    return vectors
+
+
+def exact_top_k(scores, k):
+    return np.argsort(-scores, kind='stable')[:k]
+
+
+def create_embeddings(n, seed=0, vectorizer=None):
+    """Create ``n`` Metadata rows with stored TF-IDF and BERT vectors; returns the dataset ids."""
+    rng = np.random.default_rng(seed)
+    texts = random_texts(n, seed)
+    vectorizer = vectorizer or TfidfVectorizer().fit(texts)
+    tfidf = vectorizer.transform(texts).astype(np.float32).tocsr()
+    ids = []
+    for i, text in enumerate(texts):
+        dataset = Metadata.objects.create(
+            title=text.split()[0], description=text, source=['kaggle', 'uci'][i % 2],
+            url=f'https://example.com/{seed}/{i}', size=['2 MB', '3 GB', '500 kB', ''][i % 4],
+            format=['csv', 'json, csv', 'parquet'][i % 3],
+        )
+        row = tfidf[i]
+        tfidf_indices, tfidf_values = encode_sparse(row.indices, row.data)
+        bert_vector, bert_dim = encode_dense(rng.standard_normal(16).astype(np.float32))
+        Embedding.objects.create(dataset=dataset, tfidf_indices=tfidf_indices, tfidf_values=tfidf_values,
+                                 tfidf_dim=tfidf.shape[1], bert_vector=bert_vector, bert_dim=bert_dim,
+                                 combined_normalized_text=text)
+        ids.append(dataset.id)
+    return ids
+
+
+def fake_bert_encode(texts, **kwargs):
+    """Deterministic stand-in for the SentenceTransformer: one 16-d vector per text."""
+    return np.stack([np.random.default_rng(abs(hash(text)) % 2 ** 32).standard_normal(16).astype(np.float32)
+                     for text in texts])
+
+
+@override_settings(QUERY_LOGGING_ENABLED=False, QUERY_BATCHING_ENABLED=False, QUERY_RESULT_CACHE_BACKEND='locmem',
+                   BERT_SEARCH_BACKEND='exact', LEXICAL_BACKEND='cosine', BERT_QUANTIZATION='none',
+                   EMBEDDING_INDEX_SOURCE='database')
+class SearchTestCase(TestCase):
+    """Ranks against a small corpus with a throwaway TF-IDF vectorizer and a fake BERT model."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'tfidf_vectorizer.pkl')
+        vectorizer = TfidfVectorizer().fit(random_texts(40))
+        joblib.dump(vectorizer, path)
+        self.ids = create_embeddings(40, vectorizer=vectorizer)
+
+        settings = override_settings(TFIDF_VECTORIZER_PATH=path)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        # get_bert_model() returns the fake as long as its version matches
+        self.model = mock.Mock(encode=mock.Mock(side_effect=fake_bert_encode))
+        for patcher in [mock.patch.object(encoders, '_tfidf', (None, None)),
+                        mock.patch.object(encoders, '_bert', (self.model, 'fake-bert')),
+                        mock.patch.object(encoders, '_bert_version', return_value='fake-bert')]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        encoders.query_embedding_cache.clear()
+        embedding_index.invalidate()
+        self.addCleanup(embedding_index.invalidate)
+
+
+class EmbeddingIndexTests(TestCase):
+    def setUp(self):
+        self.ids = create_embeddings(5)
+        embedding_index.invalidate()
+
+    def tearDown(self):
+        embedding_index.invalidate()
+
+    def test_save_signals_drop_the_shared_index(self):
+        self.assertEqual(len(embedding_index.get()), 5)
+        create_embeddings(1, seed=1)
+        self.assertFalse(embedding_index.is_loaded)
+        self.assertEqual(len(embedding_index.get()), 6)
+
+        Metadata.objects.get(id=self.ids[0]).delete()
+        self.assertFalse(embedding_index.is_loaded)
+        self.assertNotIn(self.ids[0], embedding_index.get().dataset_ids.tolist())
+
+    def test_watermark_change_reloads_without_signals(self):
+        index = EmbeddingIndex(refresh_interval=0, quantization='none', source='database')
+        data = index.get()
+        self.assertIs(index.get(), data)
+
+        # Queryset updates send no signals, like writes from another process
+        Metadata.objects.filter(id=self.ids[2]).update(title='renamed', updated_at=timezone.now())
+        reloaded = index.get()
+        self.assertIsNot(reloaded, data)
+        row = reloaded.dataset_ids.tolist().index(self.ids[2])
+        self.assertEqual(reloaded.metadata[row]['title'], 'renamed')
+
+
+class MigrationTestCase(TransactionTestCase):
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes('recommendations'))
+
+
+class BinaryVectorMigrationTests(MigrationTestCase):
+    """Migrations 0009-0011 must carry JSON vectors to the binary columns and back."""
+
+    before = [('recommendations', '0008_alter_metadata_title')]
+    after = [('recommendations', '0011_remove_embedding_json_vectors')]
+
+    def test_json_vectors_round_trip(self):
+        apps = self.migrate(self.before)
+        Metadata = apps.get_model('recommendations', 'Metadata')
+        Embedding = apps.get_model('recommendations', 'Embedding')
+        rows = {
+            'dense': ([0.0, 0.5, 0.0, 0.25], [0.1, -0.2, 0.3]),
+            'sparse': ({'indices': [1, 7], 'values': [0.5, 0.75], 'dim': 9}, [0.4, 0.5, -0.6]),
+        }
+        for title, (tfidf_embedding, bert_embedding) in rows.items():
+            dataset = Metadata.objects.create(title=title, description=title, source='kaggle',
+                                              url=f'https://example.com/{title}', size='1 MB', format='csv')
+            Embedding.objects.create(dataset=dataset, tfidf_embedding=tfidf_embedding,
+                                     bert_embedding=bert_embedding)
+
+        Embedding = self.migrate(self.after).get_model('recommendations', 'Embedding')
+        expected = {'dense': ([1, 3], [0.5, 0.25], 4), 'sparse': ([1, 7], [0.5, 0.75], 9)}
+        for embedding in Embedding.objects.select_related('dataset'):
+            indices, values, dim = expected[embedding.dataset.title]
+            stored_indices, stored_values = decode_sparse(embedding.tfidf_indices, embedding.tfidf_values)
+            self.assertEqual(stored_indices.tolist(), indices)
+            np.testing.assert_allclose(stored_values, values)
+            self.assertEqual(embedding.tfidf_dim, dim)
+            np.testing.assert_allclose(decode_dense(embedding.bert_vector), rows[embedding.dataset.title][1],
+                                       rtol=1e-6)
+            self.assertEqual(embedding.bert_dim, 3)
+
+        Embedding = self.migrate(self.before).get_model('recommendations', 'Embedding')
+        for embedding in Embedding.objects.select_related('dataset'):
+            indices, values, dim = expected[embedding.dataset.title]
+            self.assertEqual(embedding.tfidf_embedding['indices'], indices)
+            np.testing.assert_allclose(embedding.tfidf_embedding['values'], values)
+            self.assertEqual(embedding.tfidf_embedding['dim'], dim)
+            np.testing.assert_allclose(embedding.bert_embedding, rows[embedding.dataset.title][1], rtol=1e-6)
+
+
+class SelectTopKTests(TestCase):
+    def test_matches_full_sort(self):
+        scores = np.random.default_rng(0).standard_normal(1000).astype(np.float32)
+        order = np.argsort(-scores, kind='stable')
+        for top_k, offset in [(10, 0), (10, 25), (1000, 0), (5, 998), (5, 1000)]:
+            np.testing.assert_array_equal(select_top_k(scores, top_k, offset), order[offset:offset + top_k])
+
+    def test_selected_ties_keep_row_order(self):
+        scores = np.array([0.5, 0.9, 0.5, 0.1, 0.9, 0.5], dtype=np.float32)
+        np.testing.assert_array_equal(select_top_k(scores, 5), [1, 4, 0, 2, 5])
+        np.testing.assert_array_equal(select_top_k(scores, 4, offset=1), [4, 0, 2, 5])
+
+    @override_settings(QUERY_DEFAULT_TOP_K=10, QUERY_MAX_TOP_K=100)
+    def test_parse_pagination(self):
+        self.assertEqual(parse_pagination({}), (10, 0, None))
+        self.assertEqual(parse_pagination({'top_k': '20', 'offset': 40}), (20, 40, None))
+        for data in [{'top_k': 'ten'}, {'top_k': 0}, {'top_k': 101}, {'offset': -1}, {'offset': None}]:
+            top_k, offset, error = parse_pagination(data)
+            self.assertIsNone(top_k)
+            self.assertTrue(error)
+
+
+class IVFIndexTests(TestCase):
+    def setUp(self):
+        self.vectors = unit_rows(500, 32)
+        self.dataset_ids = np.arange(1, 501, dtype=np.int64)
+        self.ivf = IVFIndex.build(self.vectors, self.dataset_ids, n_lists=10)
+
+    def test_probing_every_list_is_exact(self):
+        query = self.vectors[7]
+        rows = self.ivf.candidate_rows(query, self.dataset_ids, nprobe=self.ivf.n_lists)
+        np.testing.assert_array_equal(np.sort(rows), np.arange(len(self.vectors)))
+
+    def test_partial_probe_finds_the_query_row(self):
+        query = self.vectors[7]
+        rows = self.ivf.candidate_rows(query, self.dataset_ids, nprobe=3)
+        self.assertIn(7, rows)
+        self.assertLess(len(rows), len(self.vectors))
+        self.assertEqual(len(np.unique(rows)), len(rows))
+
+    def test_unindexed_rows_are_always_searched(self):
+        dataset_ids = np.append(self.dataset_ids, 501)
+        rows = self.ivf.candidate_rows(self.vectors[0], dataset_ids, nprobe=1)
+        self.assertIn(500, rows)
+
+    def test_filtered_probe_returns_allowed_rows_only(self):
+        allowed = np.arange(0, 500, 7)
+        rows = self.ivf.candidate_rows(self.vectors[3], self.dataset_ids, nprobe=1, allowed=allowed,
+                                       min_candidates=40)
+        self.assertTrue(np.isin(rows, allowed).all())
+        self.assertGreaterEqual(len(rows), 40)
+
+
+class MaxScoreTests(TestCase):
+    """MaxScore pruning must return exactly the brute-force top k."""
+
+    def setUp(self):
+        texts = random_texts(400)
+        self.vectorizer = TfidfVectorizer().fit(texts)
+        self.tfidf_matrix = self.vectorizer.transform(texts).astype(np.float32).tocsr()
+        self.texts = texts
+
+    def brute_force(self, index, term_ids, weights):
+        scores = np.zeros(index.n_rows, dtype=np.float32)
+        for term, weight in zip(term_ids, weights):
+            start, end = index.ptr[term], index.ptr[term + 1]
+            scores[index.rows[start:end]] += index.weights[start:end] * weight
+        return scores
+
+    def check_pruned(self, index, queries):
+        for query in queries:
+            term_ids, weights = index.query_terms(query, self.vectorizer.transform([query]))
+            expected = self.brute_force(index, term_ids, weights)
+            rows, scores = index.score(term_ids, weights)
+            np.testing.assert_allclose(scores, expected[rows], rtol=1e-5)
+            for top_k in (1, 5, 20):
+                rows, scores = index.score(term_ids, weights, top_k=top_k)
+                kth = np.sort(expected)[::-1][top_k - 1]
+                self.assertEqual(len(rows), min(top_k, np.count_nonzero(expected)))
+                np.testing.assert_allclose(scores, expected[rows], rtol=1e-5)
+                self.assertTrue(np.all(scores >= kth - 1e-5))
+
+    def test_tfidf_top_k_matches_brute_force(self):
+        index = InvertedIndex.from_tfidf_matrix(self.tfidf_matrix, self.vectorizer)
+        self.check_pruned(index, ['sales orders', 'climate weather city', 'crime', 'movies ratings rent cases'])
+
+    def test_bm25_top_k_matches_brute_force(self):
+        index = InvertedIndex.from_texts(self.texts, self.vectorizer)
+        self.check_pruned(index, ['sales sales orders', 'flights delays city', 'unknown words only'])
+
+
+class LRUCacheTests(TestCase):
+    def test_hits_misses_and_eviction(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)  # evicts 'b', the least recently used
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+        stats = cache.stats()
+        self.assertEqual((stats['size'], stats['hits'], stats['misses']), (2, 2, 1))
+
+    def test_entries_expire_after_ttl(self):
+        cache = LRUCache(10, ttl=60)
+        with mock.patch('recommendations.query_processing.query_cache.time.monotonic', return_value=1000.0):
+            cache.set('a', 1)
+        with mock.patch('recommendations.query_processing.query_cache.time.monotonic', return_value=1059.0):
+            self.assertEqual(cache.get('a'), 1)
+        with mock.patch('recommendations.query_processing.query_cache.time.monotonic', return_value=1061.0):
+            self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_zero_maxsize_disables_caching(self):
+        cache = LRUCache(0)
+        cache.set('a', 1)
+        self.assertIsNone(cache.get('a'))
+
+    def test_vectorizer_change_clears_query_embeddings(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'tfidf_vectorizer.pkl')
+            joblib.dump(TfidfVectorizer().fit(random_texts(20)), path)
+            with override_settings(TFIDF_VECTORIZER_PATH=path), \
+                    mock.patch.object(encoders, '_tfidf', (None, None)):
+                _, version = encoders.get_tfidf_vectorizer()
+                encoders.query_embedding_cache.set(('tfidf', version, 'sales'), 'cached')
+                self.assertEqual(encoders.get_tfidf_vectorizer()[1], version)
+                self.assertEqual(encoders.query_embedding_cache.get(('tfidf', version, 'sales')), 'cached')
+
+                joblib.dump(TfidfVectorizer().fit(random_texts(20, seed=1)), path)
+                os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10 ** 9))
+                self.assertNotEqual(encoders.get_tfidf_vectorizer()[1], version)
+                self.assertIsNone(encoders.query_embedding_cache.get(('tfidf', version, 'sales')))
+
+
+class QueryValidationTests(TestCase):
+    def test_query_must_be_a_non_empty_string(self):
+        for url in ['/api/query/', '/api/query/stream/', '/api/query/async/']:
+            for query in [None, '', '   ', 42, ['sales'], {'text': 'sales'}]:
+                response = self.client.post(url, {'query': query}, content_type='application/json')
+                self.assertEqual(response.status_code, 400, (url, query))
+                self.assertIn('error', response.json())
+
+
+class ResultCacheTests(SearchTestCase):
+    def test_saves_bump_the_version(self):
+        result_cache = get_result_cache()
+        version = result_cache.version()
+        dataset = Metadata.objects.get(id=self.ids[0])
+        dataset.save()
+        self.assertGreater(result_cache.version(), version)
+        version = result_cache.version()
+        Embedding.objects.get(dataset=dataset).save()
+        self.assertGreater(result_cache.version(), version)
+
+    def test_cached_responses_are_dropped_on_save(self):
+        with mock.patch('recommendations.query_processing.process_query.rank_batch', wraps=rank_batch) as ranked:
+            first = process_query('sales orders', top_k=5)
+            self.assertEqual(process_query('Sales  ORDERS', top_k=5), first)
+            self.assertEqual(ranked.call_count, 1)
+
+            Metadata.objects.filter(id=first[0]['id']).update(title='renamed')
+            Metadata.objects.get(id=first[0]['id']).save()
+            results = process_query('sales orders', top_k=5)
+            self.assertEqual(ranked.call_count, 2)
+        self.assertEqual(results[0]['title'], 'renamed')
+
+    def test_batch_reads_the_version_once(self):
+        result_cache = get_result_cache()
+        with mock.patch.object(result_cache, 'version', wraps=result_cache.version) as version, \
+                mock.patch.object(result_cache, 'get_many', wraps=result_cache.get_many) as get_many:
+            process_queries(['sales', 'climate', 'crime city'], top_k=3)
+        self.assertEqual(version.call_count, 1)
+        self.assertEqual(get_many.call_count, 1)
+
+    def test_django_backend_round_trip(self):
+        result_cache = DjangoResultCache('default', 60)
+        result_cache.set_many({'a': [{'id': 1}], 'b': []})
+        self.assertEqual(result_cache.get_many(['a', 'b', 'c']), {'a': [{'id': 1}], 'b': []})
+
+
+class QueryBatchApiTests(SearchTestCase):
+    queries = ['sales orders', 'climate', 'crime city', 'movies ratings', 'flights']
+
+    def post(self, data):
+        return self.client.post('/api/query/batch/', data, content_type='application/json')
+
+    def assertSameRanking(self, results, expected):
+        self.assertEqual([[result['id'] for result in rows] for rows in results],
+                         [[result['id'] for result in rows] for rows in expected])
+        for rows, expected_rows in zip(results, expected):
+            np.testing.assert_allclose([result['similarity_score'] for result in rows],
+                                       [result['similarity_score'] for result in expected_rows], rtol=1e-5)
+
+    def test_results_follow_input_order(self):
+        expected = [process_query(query, top_k=4) for query in self.queries]
+        response = self.post({'queries': self.queries, 'top_k': 4})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [{'query': query, 'results': results}
+                                           for query, results in zip(self.queries, expected)])
+
+    @override_settings(QUERY_BATCH_CHUNK_SIZE=2, QUERY_RESULT_CACHE_BACKEND='none')
+    def test_chunks_encode_together(self):
+        with mock.patch('recommendations.query_processing.result_cache._result_cache', None):
+            chunked = self.post({'queries': self.queries, 'top_k': 4}).json()
+        # Three chunks of at most two queries, one BERT forward pass each
+        self.assertEqual([len(call.args[0]) for call in self.model.encode.call_args_list], [2, 2, 1])
+        self.assertSameRanking([item['results'] for item in chunked],
+                               [process_query(query, top_k=4) for query in self.queries])
+
+    @override_settings(QUERY_BATCH_MAX_QUERIES=3)
+    def test_invalid_batches_are_rejected(self):
+        for data in [{}, {'queries': []}, {'queries': 'sales'}, {'queries': ['sales', 7]},
+                     {'queries': ['sales', ' ']}, {'queries': ['a', 'b', 'c', 'd']},
+                     {'queries': ['sales'], 'top_k': 0}, {'queries': ['sales'], 'filters': {'colour': 'red'}}]:
+            self.assertEqual(self.post(data).status_code, 400, data)
+
+
+class ReadinessTests(SearchTestCase):
+    def setUp(self):
+        super().setUp()
+        for patcher in [mock.patch.dict(readiness._state, status='idle', error=None, seconds=None, prewarm=None),
+                        mock.patch.object(readiness, '_warmup_thread', None)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def get(self):
+        return self.client.get('/api/ready/')
+
+    @override_settings(QUERY_WARMUP_ON_STARTUP=True)
+    def test_first_check_starts_one_warmup(self):
+        with mock.patch.object(readiness.threading, 'Thread') as thread:
+            self.assertEqual(self.get().status_code, 503)
+            self.get()
+        thread.assert_called_once_with(target=readiness.run_warmup, name='query-warmup', daemon=True)
+        thread.return_value.start.assert_called_once_with()
+
+    @override_settings(QUERY_WARMUP_ON_STARTUP=False, QUERY_PREWARM_ON_STARTUP=False)
+    def test_ready_after_warmup(self):
+        self.assertEqual(self.get().status_code, 503)
+        readiness.run_warmup()
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        report = response.json()
+        self.assertEqual(report['warmup']['status'], 'ready')
+        self.assertEqual(report['components'], {'tfidf_vectorizer': True, 'bert_model': True, 'embedding_index': True})
+        self.model.encode.assert_called_with(['warmup'])
+
+    @override_settings(QUERY_WARMUP_ON_STARTUP=False)
+    def test_failed_warmup_is_reported(self):
+        with mock.patch('recommendations.query_processing.process_query.warm_up', side_effect=OSError('no model')):
+            readiness.run_warmup()
+        response = self.get()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['warmup']['error'], 'no model')
+
+    def test_fork_forgets_a_running_warmup(self):
+        readiness._state['status'] = 'warming'
+        readiness._warmup_thread = mock.Mock()
+        # Locks held by parent threads that do not exist after fork
+        held = threading.Lock()
+        held.acquire()
+        with mock.patch.object(readiness, '_lock', held), mock.patch.object(encoders, '_lock', held):
+            readiness._reset_after_fork()
+            encoders._reset_lock_after_fork()
+            self.assertEqual(readiness._state['status'], 'idle')
+            self.assertIsNone(readiness._warmup_thread)
+            self.assertFalse(readiness._lock.locked())
+            self.assertFalse(encoders._lock.locked())
+
+
+class EncodeBatcherTests(TestCase):
+    def test_concurrent_texts_share_one_encode(self):
+        encode = mock.Mock(side_effect=fake_bert_encode)
+        batcher = EncodeBatcher(encode, window_ms=200, max_batch=8)
+        texts = ['sales', 'climate', 'sales', 'crime']
+        futures = [batcher.submit(text) for text in texts]
+        for text, future in zip(texts, futures):
+            np.testing.assert_array_equal(future.result(timeout=5), fake_bert_encode([text]))
+        encode.assert_called_once_with(['sales', 'climate', 'crime'])
+        self.assertEqual(batcher.stats()['batches'], 1)
+
+    def test_batches_are_capped_at_max_batch(self):
+        encode = mock.Mock(side_effect=fake_bert_encode)
+        batcher = EncodeBatcher(encode, window_ms=200, max_batch=2)
+        futures = [batcher.submit(f'query {i}') for i in range(5)]
+        for future in futures:
+            future.result(timeout=5)
+        self.assertEqual([len(call.args[0]) for call in encode.call_args_list], [2, 2, 1])
+
+    def test_errors_reach_every_caller(self):
+        encode = mock.Mock(side_effect=[RuntimeError('out of memory'), fake_bert_encode(['later'])])
+        batcher = EncodeBatcher(encode, window_ms=200)
+        futures = [batcher.submit(text) for text in ['a', 'b', 'c']]
+        for future in futures:
+            with self.assertRaisesRegex(RuntimeError, 'out of memory'):
+                future.result(timeout=5)
+        # The worker survives a failed batch
+        np.testing.assert_array_equal(batcher.encode('later', timeout=5), fake_bert_encode(['later']))
+
+    def test_aencode_awaits_the_batch(self):
+        batcher = EncodeBatcher(fake_bert_encode, window_ms=1)
+        np.testing.assert_array_equal(asyncio.run(batcher.aencode('sales')), fake_bert_encode(['sales']))
+
+
+@override_settings(QUERY_BATCHING_ENABLED=True)
+class AsyncEncodeTests(SearchTestCase):
+    def test_async_view_encodes_through_the_batcher(self):
+        # Loaded up front: an index reload would run on a worker thread, outside the test
+        # transaction, and loading the vectorizer clears the query embedding cache
+        embedding_index.get()
+        encoders.get_tfidf_vectorizer()
+        batcher = EncodeBatcher(mock.Mock(side_effect=fake_bert_encode), window_ms=1)
+        with mock.patch('recommendations.query_processing.process_query.get_encode_batcher', return_value=batcher):
+            response = self.client.post('/api/query/async/', {'query': 'Sales orders', 'top_k': 3},
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()), 3)
+            self.client.post('/api/query/async/', {'query': 'sales  ORDERS', 'top_k': 5},
+                             content_type='application/json')
+        # Encoded once on the event loop; the pool only scored
+        batcher._encode.assert_called_once_with(['Sales orders'])
+        self.model.encode.assert_not_called()
+
+
+class AsyncQueryApiTests(SearchTestCase):
+    def setUp(self):
+        super().setUp()
+        # Loaded up front: an index reload would run on a worker thread, outside the test transaction
+        embedding_index.get()
+        for patcher in [mock.patch.object(executor, '_executor', None), mock.patch.object(executor, '_slots', None)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def post(self, url, data):
+        return self.client.post(url, data, content_type='application/json')
+
+    def test_matches_the_sync_view(self):
+        data = {'query': 'climate weather', 'top_k': 5, 'offset': 2, 'filters': {'source': 'kaggle'}}
+        response = self.post('/api/query/async/', data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), self.post('/api/query/', data).json())
+
+    @override_settings(QUERY_ASYNC_MAX_WORKERS=1, QUERY_ASYNC_MAX_QUEUE=0)
+    def test_full_pool_is_rejected_with_503(self):
+        pool = executor.get_query_executor()
+        self.addCleanup(pool.shutdown)
+        # Take the only slot, as a query still running would
+        self.assertTrue(executor._slots.acquire(blocking=False))
+        response = self.post('/api/query/async/', {'query': 'sales'})
+        self.assertEqual(response.status_code, 503)
+        executor._slots.release()
+        self.assertEqual(self.post('/api/query/async/', {'query': 'sales'}).status_code, 200)
+
+
+class QuantizationTests(TestCase):
+    def setUp(self):
+        self.vectors = unit_rows(600, 64)
+        self.queries = unit_rows(5, 64, seed=1)
+
+    def test_dot_matches_decoded_rows(self):
+        for quantized in (Float16Matrix.build(self.vectors), Int8Matrix.build(self.vectors),
+                          PQMatrix.build(self.vectors, n_subvectors=8, n_codewords=32)):
+            out = np.empty((len(self.queries), len(self.vectors)), dtype=np.float32)
+            quantized.dot(self.queries, out)
+            rows = np.array([0, 5, 599])
+            np.testing.assert_allclose(out[:, rows], self.queries @ quantized.decode(rows).T, atol=1e-4)
+            np.testing.assert_allclose(quantized.dot_rows(self.queries[0], rows), out[0, rows], atol=1e-4)
+
+    def test_int8_is_close_to_exact(self):
+        out = np.empty((len(self.queries), len(self.vectors)), dtype=np.float32)
+        Int8Matrix.build(self.vectors).dot(self.queries, out)
+        np.testing.assert_allclose(out, self.queries @ self.vectors.T, atol=0.02)
+
+    def test_rerank_improves_recall(self):
+        report = evaluate_quantization(self.vectors, ['int8', 'pq'], k=10, rerank=100, n_queries=50,
+                                       pq_subvectors=8, pq_codewords=32)
+        for row in report:
+            self.assertGreaterEqual(row['reranked_recall'], row['recall'])
+        self.assertGreater(report[0]['recall'], 0.9)
+        self.assertGreater(report[1]['reranked_recall'], 0.9)
+
+    def test_rerank_bert_restores_exact_ranking(self):
+        index = IndexData(np.arange(len(self.vectors)), sparse.csr_matrix((len(self.vectors), 1), dtype=np.float32),
+                          PQMatrix.build(self.vectors, n_subvectors=8, n_codewords=32), [None] * len(self.vectors), 0)
+        index.full_bert_matrix = self.vectors
+        scores = np.empty((len(self.queries), len(self.vectors)), dtype=np.float32)
+        index.bert_matrix.dot(self.queries, scores)
+        candidates = rerank_bert(self.queries, index, scores, len(self.vectors))
+        exact = self.queries @ self.vectors.T
+        for i in range(len(self.queries)):
+            np.testing.assert_allclose(scores[i, candidates[i]], exact[i, candidates[i]], atol=1e-5)
+            np.testing.assert_array_equal(exact_top_k(scores[i], 10), exact_top_k(exact[i], 10))
+
+
+class LoadBertRowsTests(TestCase):
+    def test_deleted_datasets_are_reported_missing(self):
+        ids = create_embeddings(3)
+        Embedding.objects.filter(dataset_id=ids[1]).delete()
+        matrix, found = load_bert_rows(ids, 16)
+        np.testing.assert_array_equal(found, [True, False, True])
+        np.testing.assert_array_equal(matrix[1], np.zeros(16))
+        np.testing.assert_allclose(np.linalg.norm(matrix[[0, 2]], axis=1), 1.0, rtol=1e-5)
+
+
+class SnapshotTests(TestCase):
+    def setUp(self):
+        create_embeddings(50)
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'index.snapshot')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def load_database(self):
+        return EmbeddingIndex(refresh_interval=0, quantization='none', source='database', load_texts=True).get()
+
+    def test_round_trip_matches_database_load(self):
+        data = self.load_database()
+        write_snapshot(self.path, data)
+        with override_settings(EMBEDDING_SNAPSHOT_PATH=self.path, EMBEDDING_SNAPSHOT_VERIFY=True):
+            mapped = EmbeddingIndex(refresh_interval=0, quantization='none', source='snapshot',
+                                    load_texts=True).get()
+
+        np.testing.assert_array_equal(mapped.dataset_ids, data.dataset_ids)
+        np.testing.assert_array_equal(mapped.bert_matrix, data.bert_matrix)
+        self.assertEqual((mapped.tfidf_matrix != data.tfidf_matrix).nnz, 0)
+        self.assertEqual((mapped.tfidf_matrix_t != data.tfidf_matrix_t).nnz, 0)
+        self.assertEqual(mapped.metadata, data.metadata)
+        self.assertEqual(mapped.texts, data.texts)
+        query = unit_rows(1, 16, seed=3)[0]
+        np.testing.assert_array_equal(exact_top_k(mapped.bert_matrix @ query, 10),
+                                      exact_top_k(data.bert_matrix @ query, 10))
+
+    def test_missing_texts_are_an_error(self):
+        data = self.load_database()
+        data.texts = None
+        header = write_snapshot(self.path, data)
+        with self.assertRaises(SnapshotError):
+            open_snapshot(self.path, header['index_version'], load_texts=True)
+        self.assertIsNone(open_snapshot(self.path, header['index_version']).texts)
+
+    def test_checksum_mismatch_is_detected(self):
+        header = write_snapshot(self.path, self.load_database())
+        with open(self.path, 'r+b') as f:
+            f.seek(-1, os.SEEK_END)
+            last = f.read(1)
+            f.seek(-1, os.SEEK_END)
+            f.write(bytes([last[0] ^ 0xFF]))
+        with self.assertRaises(SnapshotError):
+            open_snapshot(self.path, header['index_version'], verify=True)
+
+    def test_command_refuses_to_drop_texts_for_bm25(self):
+        with override_settings(LEXICAL_BACKEND='bm25'), self.assertRaises(CommandError):
+            call_command('write_embedding_snapshot', output=self.path, no_texts=True, stdout=io.StringIO())
+        self.assertFalse(os.path.exists(self.path))
+        call_command('write_embedding_snapshot', output=self.path, no_texts=True, stdout=io.StringIO())
+        self.assertEqual(len(open_snapshot(self.path, None).dataset_ids), 50)
+
+
+class FilterTests(TestCase):
+    def setUp(self):
+        self.metadata = [
+            {'format': ['csv', 'JSON, csv', '.parquet', ''][i % 4], 'source': ['Kaggle', 'uci', None][i % 3],
+             'size': ['2 MB', '3 GiB', '500kB', 'unknown', '12000000'][i % 5]}
+            for i in range(60)
+        ]
+        self.metadata[10] = None  # dataset without a Metadata row
+        self.index = FilterIndex.build(self.metadata)
+
+    def brute_force(self, filters):
+        rows = []
+        for row, fields in enumerate(self.metadata):
+            if not fields:
+                continue
+            values = {
+                'format': format_values(fields['format']),
+                'source': {normalize_value(fields['source'])},
+                'size': {size_bucket(fields['size'])},
+            }
+            if all(values[field] & set(wanted) for field, wanted in filters.items()):
+                rows.append(row)
+        return rows
+
+    def test_masks_match_brute_force(self):
+        for raw in [{'format': 'csv'}, {'format': ['.PARQUET', 'json']}, {'source': 'kaggle', 'size': 'small'},
+                    {'size': ['large', 'unknown']}, {'format': 'csv', 'source': ['uci', 'kaggle'], 'size': 'medium'},
+                    {'format': 'xml'}]:
+            filters, error = parse_filters(raw)
+            self.assertIsNone(error)
+            self.assertEqual(self.index.allowed_rows(filters).tolist(), self.brute_force(filters))
+
+    def test_invalid_filters_are_rejected(self):
+        for raw in ['csv', {'colour': 'red'}, {'format': []}, {'format': [1]}, {'size': 'huge'}]:
+            filters, error = parse_filters(raw)
+            self.assertIsNone(filters)
+            self.assertTrue(error)
+
+
+class FilteredQueryTests(SearchTestCase):
+    def test_filtered_ranking_is_the_unfiltered_ranking_restricted(self):
+        everything = process_query('sales orders', top_k=40)
+        filters, _ = parse_filters({'source': 'uci', 'format': 'csv'})
+        filtered = process_query('sales orders', top_k=40, filters=filters)
+        self.assertTrue(filtered)
+        self.assertEqual([result['id'] for result in filtered],
+                         [result['id'] for result in everything
+                          if result['source'] == 'uci' and 'csv' in result['format']])
+
+
+@override_settings(QUERY_STREAM_CHUNK_SIZE=10, QUERY_MAX_TOP_K=10, QUERY_STREAM_MAX_TOP_K=100)
+class QueryStreamApiTests(SearchTestCase):
+    def post(self, data):
+        return self.client.post('/api/query/stream/', data, content_type='application/json')
+
+    def test_streams_ranked_ndjson_lines(self):
+        response = self.post({'query': 'climate weather', 'top_k': 25, 'offset': 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        chunks = list(response.streaming_content)
+        self.assertEqual(len(chunks), 3)
+        lines = [json.loads(line) for line in b''.join(chunks).decode().splitlines()]
+        self.assertEqual([line['rank'] for line in lines], list(range(4, 29)))
+
+        expected = process_queries(['climate weather'], top_k=25, offset=3, log=False)[0]
+        self.assertEqual([line['id'] for line in lines], [result['id'] for result in expected])
+        np.testing.assert_allclose([line['similarity_score'] for line in lines],
+                                   [result['similarity_score'] for result in expected], rtol=1e-5)
+
+    def test_stream_has_its_own_top_k_limit(self):
+        self.assertEqual(self.post({'query': 'sales', 'top_k': 40}).status_code, 200)
+        self.assertEqual(self.post({'query': 'sales', 'top_k': 101}).status_code, 400)
+
+
+class QueryLogWriterTests(TransactionTestCase):
+    def setUp(self):
+        self.ids = create_embeddings(3)
+
+    def test_results_for_deleted_datasets_are_skipped(self):
+        writer = QueryLogWriter()
+        Metadata.objects.filter(id=self.ids[1]).delete()
+        writer._write([
+            ('first', [(self.ids[0], 0.9), (self.ids[1], 0.8), (self.ids[2], 0.7)], 1.5),
+            ('second', [(self.ids[2], 0.5)], 2.0),
+        ])
+        self.assertEqual(writer.stats()['written'], 2)
+        first = Query.objects.get(query_text='first')
+        self.assertEqual(list(QueryResult.objects.filter(query=first).order_by('rank')
+                              .values_list('rank', 'dataset_id')), [(1, self.ids[0]), (3, self.ids[2])])
+
+    def test_flush_writes_the_batch_being_collected(self):
+        writer = QueryLogWriter(flush_items=100, flush_ms=60000)
+        for i in range(5):
+            writer.log(f'query {i}', [{'id': self.ids[0], 'similarity_score': 0.5}], 1.0)
+        writer.flush()
+        self.assertFalse(writer._worker.is_alive())
+        self.assertEqual(Query.objects.count(), 5)
+        self.assertEqual(writer.stats()['written'], 5)
+
+    def test_counters_are_thread_safe(self):
+        writer = QueryLogWriter(max_queue=100000, flush_ms=60000)
+        with mock.patch.object(QueryLogWriter, '_ensure_worker'):
+            threads = [threading.Thread(target=lambda: [writer.log('q', [], 1.0) for _ in range(2000)])
+                       for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(writer.stats()['logged'], 8000)
+
+
+class PrewarmTests(SearchTestCase):
+    def setUp(self):
+        super().setUp()
+        logged = {'Sales Orders': 5, 'sales  orders': 2, 'climate': 4, 'crime city': 3, 'movies': 1, '  ': 9}
+        for query_text, n in logged.items():
+            Query.objects.bulk_create([Query(query_text=query_text) for _ in range(n)])
+
+    def test_popular_queries_keep_the_common_spelling(self):
+        self.assertEqual(popular_queries(10), ['Sales Orders', 'climate', 'crime city', 'movies'])
+        self.assertEqual(popular_queries(2), ['Sales Orders', 'climate'])
+
+    def test_warms_the_caches_within_the_query_budget(self):
+        report = prewarm_caches(max_queries=3, max_seconds=0, days=0, chunk_size=2)
+        self.assertEqual((report['queries'], report['candidates']), (3, 3))
+        self.assertEqual([len(call.args[0]) for call in self.model.encode.call_args_list], [2, 1])
+        self.assertEqual(self.model.encode.call_args_list[0].args[0], ['Sales Orders', 'climate'])
+        # Warming neither logs queries nor has to be repeated by the first real request
+        self.assertEqual(Query.objects.count(), 24)
+        with mock.patch('recommendations.query_processing.process_query.rank_batch') as ranked:
+            process_query('sales orders')
+        ranked.assert_not_called()
+
+    def test_stops_when_the_time_budget_is_spent(self):
+        clock = [0.0]
+
+        def slow_chunk(query_texts, **kwargs):
+            clock[0] += 0.6
+
+        with mock.patch('recommendations.query_processing.prewarm.time') as time_mock, \
+                mock.patch('recommendations.query_processing.process_query.process_queries',
+                           side_effect=slow_chunk) as processed:
+            time_mock.perf_counter.side_effect = lambda: clock[0]
+            report = prewarm_caches(max_queries=10, max_seconds=1, days=0, chunk_size=1)
+        self.assertEqual((report['queries'], report['candidates']), (2, 4))
+        self.assertEqual([call.args[0] for call in processed.call_args_list], [['Sales Orders'], ['climate']])
+
+
+class GenerateEmbeddingsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from .query_processing import generate_embeddings
+
+        cls.pipeline = generate_embeddings
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.checkpoint = os.path.join(self.directory.name, 'checkpoint.json')
+        texts = random_texts(23)
+        for i, text in enumerate(texts):
+            Metadata.objects.create(title=f'title {i % 5}', description=text if i % 4 else 'mirrored  text',
+                                    source='kaggle', url=f'https://example.com/{i}', size='1 MB', format='csv')
+        self.model = mock.Mock(encode=mock.Mock(side_effect=fake_bert_encode))
+        self.tokenizer = lambda texts, **kwargs: {'input_ids': [text.split() for text in texts]}
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_pipeline(self, **kwargs):
+        with mock.patch.object(self.pipeline, 'get_bert_model', return_value=self.model), \
+                mock.patch.object(self.pipeline, 'get_bert_tokenizer', return_value=(self.tokenizer, 512)):
+            self.pipeline.process_metadata_for_embeddings(incremental=False, chunk_size=5, workers=0,
+                                                          checkpoint_path=self.checkpoint, **kwargs)
+
+    def stored(self):
+        return {
+            embedding.dataset_id: (embedding.content_hash, bytes(embedding.vector.bert_vector),
+                                   bytes(embedding.vector.tfidf_indices), bytes(embedding.vector.tfidf_values))
+            for embedding in Embedding.objects.select_related('vector')
+        }
+
+    def test_length_bucketing_restores_input_order(self):
+        texts = random_texts(50, seed=4)
+        with mock.patch.object(self.pipeline, 'get_bert_model', return_value=self.model), \
+                mock.patch.object(self.pipeline, 'get_bert_tokenizer', return_value=(self.tokenizer, 512)):
+            order, batches = self.pipeline.length_sorted_batches(texts, 8)
+            lengths = [len(text.split()) for batch in batches for text in batch]
+            self.assertEqual(lengths, sorted(lengths))
+            embeddings = self.pipeline.generate_bert_embeddings(texts, batch_size=8)
+        np.testing.assert_array_equal(embeddings, fake_bert_encode(texts))
+
+    def test_identical_texts_share_one_vector(self):
+        self.run_pipeline()
+        self.assertEqual(Embedding.objects.count(), 23)
+        mirrors = Embedding.objects.filter(combined_normalized_text='title 0 mirrored text')
+        self.assertGreater(mirrors.count(), 1)
+        self.assertEqual(mirrors.values('vector').distinct().count(), 1)
+        self.assertIsNone(mirrors.first().bert_vector)
+
+    def test_resumed_run_matches_fresh_run(self):
+        self.run_pipeline()
+        fresh = self.stored()
+        Embedding.objects.all().delete()
+        self.pipeline.delete_orphan_vectors()
+
+        store_embeddings = self.pipeline.store_embeddings
+        calls = []
+
+        def interrupted(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 3:
+                raise KeyboardInterrupt
+            return store_embeddings(*args, **kwargs)
+
+        with mock.patch.object(self.pipeline, 'store_embeddings', side_effect=interrupted):
+            with self.assertRaises(KeyboardInterrupt):
+                self.run_pipeline()
+        self.assertEqual(Embedding.objects.count(), 10)
+        self.assertTrue(os.path.exists(self.checkpoint))
+
+        self.run_pipeline()
+        self.assertFalse(os.path.exists(self.checkpoint))
+        self.assertEqual(self.stored(), fresh)
+
+    def test_unchanged_resave_is_not_selected_again(self):
+        self.run_pipeline()
+        for dataset in Metadata.objects.all():
+            dataset.save()
+        encoder_version = self.pipeline.get_encoder_version()
+        self.assertEqual(self.pipeline.stale_metadata(encoder_version).count(), 23)
+        chunks = list(self.pipeline.iter_metadata_chunks(5, incremental=True, encoder_version=encoder_version))
+        self.assertEqual(sum(len(df) for df, _ in chunks), 0)
+        self.assertEqual(self.pipeline.stale_metadata(encoder_version).count(), 0)
+
+
+class EmbeddingApiTests(TestCase):
+    def test_second_embedding_for_a_dataset_is_rejected(self):
+        dataset_id = create_embeddings(1)[0]
+        response = self.client.post('/api/embeddings/', {
+            'dataset': dataset_id, 'tfidf_embedding': [0.0, 1.0], 'bert_embedding': [0.1, 0.2],
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('dataset', response.json())
+
+
+class VectorStoreMigrationTests(MigrationTestCase):
+    def test_reversal_copies_shared_vectors_back(self):
+        apps = self.migrate([('recommendations', '0015_embedding_vector_store')])
+        Metadata = apps.get_model('recommendations', 'Metadata')
+        Embedding = apps.get_model('recommendations', 'Embedding')
+        EmbeddingVector = apps.get_model('recommendations', 'EmbeddingVector')
+        tfidf_indices, tfidf_values = encode_sparse([2, 5], [0.6, 0.8])
+        bert_vector, bert_dim = encode_dense([0.1, 0.2, 0.3])
+        vector = EmbeddingVector.objects.create(content_hash='abc', encoder_version='v1',
+                                                tfidf_indices=tfidf_indices, tfidf_values=tfidf_values,
+                                                tfidf_dim=8, bert_vector=bert_vector, bert_dim=bert_dim)
+        for i in range(2):
+            dataset = Metadata.objects.create(title=f'mirror {i}', description='same', source='kaggle',
+                                              url=f'https://example.com/{i}', size='1 MB', format='csv')
+            Embedding.objects.create(dataset=dataset, vector=vector, content_hash='abc',
+                                     combined_normalized_text='same')
+
+        Embedding = self.migrate([('recommendations', '0014_embedding_unique_dataset')]).get_model(
+            'recommendations', 'Embedding')
+        self.assertEqual(Embedding.objects.count(), 2)
+        for embedding in Embedding.objects.all():
+            self.assertEqual(bytes(embedding.bert_vector), bert_vector)
+            self.assertEqual(bytes(embedding.tfidf_indices), tfidf_indices)
+            self.assertEqual(bytes(embedding.tfidf_values), tfidf_values)
+            self.assertEqual((embedding.tfidf_dim, embedding.bert_dim), (8, 3))
+
+
+class EmbeddingVectorAdminTests(TestCase):
+    def test_vectors_are_read_only(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        create_embeddings(1)
+        vector = EmbeddingVector.objects.create(content_hash='abc', encoder_version='v1', tfidf_indices=b'',
+                                                tfidf_values=b'', tfidf_dim=0, bert_vector=b'', bert_dim=0)
+        self.assertEqual(self.client.get('/admin/recommendations/embeddingvector/').status_code, 200)
+        url = f'/admin/recommendations/embeddingvector/{vector.id}/change/'
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.post(url, {'content_hash': 'changed'}).status_code, 403)
+        self.assertEqual(self.client.get('/admin/recommendations/embeddingvector/add/').status_code, 403)
+        self.assertEqual(self.client.post(f'/admin/recommendations/embeddingvector/{vector.id}/delete/',
+                                          {'post': 'yes'}).status_code, 403)
+        self.assertTrue(EmbeddingVector.objects.filter(content_hash='abc').exists())
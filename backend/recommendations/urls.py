@@ -1,5 +1,8 @@
 from django.urls import path
-from .views import MetadataListView, EmbeddingListView, QueryListView, QueryResultListView, QueryProcessingView
+from .views import (
+    MetadataListView, EmbeddingListView, QueryListView, QueryResultListView,
+    QueryProcessingView, QueryBatchView, QueryStreamView, AsyncQueryProcessingView, ReadinessView,
+)
 
 urlpatterns = [
     path('datasets/', MetadataListView.as_view(), name='datasets-list'),
@@ -7,4 +10,8 @@ urlpatterns = [
     path('queries/', QueryListView.as_view(), name='query-list'),
     path('query-results/', QueryResultListView.as_view(), name='query-result-list'),
     path('query/', QueryProcessingView.as_view(), name='query-processing'),
+    path('query/batch/', QueryBatchView.as_view(), name='query-batch'),
+    path('query/stream/', QueryStreamView.as_view(), name='query-stream'),
+    path('query/async/', AsyncQueryProcessingView.as_view(), name='query-async'),
+    path('ready/', ReadinessView.as_view(), name='readiness'),
 ]
\ No newline at end of file
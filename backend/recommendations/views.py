@@ -1,9 +1,17 @@
+import json
+
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from .models import Metadata, Embedding, Query, QueryResult
 from .serializers import MetadataSerializer, EmbeddingSerializer, QuerySerializer, QueryResultSerializer
-from .query_processing.process_query import process_query
+from .query_processing.filters import parse_filters
+from .query_processing.readiness import readiness
 
 class MetadataListView(APIView):
     def get(self, request):
@@ -20,7 +28,7 @@ class MetadataListView(APIView):
 
 class EmbeddingListView(APIView):
     def get(self, request):
-        embeddings = Embedding.objects.all()
+        embeddings = Embedding.objects.select_related('vector')
         serializer = EmbeddingSerializer(embeddings, many=True)
         return Response(serializer.data)
 
@@ -57,11 +65,164 @@ class QueryResultListView(APIView):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+def parse_pagination(data, max_top_k=None):
+    """
+    Read ``top_k`` and ``offset`` from request data.
+
+    Returns ``(top_k, offset, error)``; ``error`` is a message when a value is invalid.
+    """
+    max_top_k = max_top_k or settings.QUERY_MAX_TOP_K
+    try:
+        top_k = int(data.get('top_k', settings.QUERY_DEFAULT_TOP_K))
+        offset = int(data.get('offset', 0))
+    except (TypeError, ValueError):
+        return None, None, "top_k and offset must be integers"
+    if not 1 <= top_k <= max_top_k:
+        return None, None, f"top_k must be between 1 and {max_top_k}"
+    if offset < 0:
+        return None, None, "offset must not be negative"
+    return top_k, offset, None
+
+def parse_query_text(data):
+    """
+    Read the ``query`` string from request data.
+
+    Returns ``(query_text, error)``; ``error`` is a message when it is missing, blank or not a string.
+    """
+    query_text = data.get('query')
+    if not isinstance(query_text, str) or not query_text.strip():
+        return None, "Query text is required and must be a non-empty string"
+    return query_text, None
+
 class QueryProcessingView(APIView):
     def post(self, request):
-        query_text = request.data.get('query')
-        if not query_text:
-            return Response({"error": "Query text is required"}, status=status.HTTP_400_BAD_REQUEST)
-        
-        results = process_query(query_text)
-        return Response(results, status=status.HTTP_200_OK)
\ No newline at end of file
+        query_text, error = parse_query_text(request.data)
+        if error:
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+
+        top_k, offset, error = parse_pagination(request.data)
+        if error:
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+        filters, error = parse_filters(request.data.get('filters'))
+        if error:
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Imported on first use so management commands skip NumPy/scikit-learn
+        from .query_processing.process_query import process_query
+
+        results = process_query(query_text, top_k=top_k, offset=offset, filters=filters)
+        return Response(results, status=status.HTTP_200_OK)
+
+class QueryBatchView(APIView):
+    def post(self, request):
+        queries = request.data.get('queries')
+        if not isinstance(queries, list) or not queries:
+            return Response({"error": "A non-empty list of queries is required"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(queries) > settings.QUERY_BATCH_MAX_QUERIES:
+            return Response({"error": f"At most {settings.QUERY_BATCH_MAX_QUERIES} queries are allowed per batch"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if not all(isinstance(query, str) and query.strip() for query in queries):
+            return Response({"error": "Every query must be a non-empty string"}, status=status.HTTP_400_BAD_REQUEST)
+
+        top_k, offset, error = parse_pagination(request.data)
+        if error:
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+        filters, error = parse_filters(request.data.get('filters'))
+        if error:
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+
+        from .query_processing.process_query import process_queries
+
+        batch_results = process_queries(queries, top_k=top_k, offset=offset, filters=filters)
+        return Response(
+            [{'query': query, 'results': results} for query, results in zip(queries, batch_results)],
+            status=status.HTTP_200_OK,
+        )
+
+class QueryStreamView(APIView):
+    """
+    Stream ranked results as NDJSON: one JSON object per line, with its rank.
+
+    Ranking runs before the response starts; result lines are then
+    serialized and sent a chunk at a time, so deep result lists keep a flat
+    memory profile and the first bytes leave as soon as ranking is done.
+    """
+
+    def post(self, request):
+        query_text, error = parse_query_text(request.data)
+        if error:
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+
+        top_k, offset, error = parse_pagination(request.data, max_top_k=settings.QUERY_STREAM_MAX_TOP_K)
+        if error:
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+        filters, error = parse_filters(request.data.get('filters'))
+        if error:
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+
+        from .query_processing.process_query import stream_query
+
+        chunks = stream_query(query_text, top_k=top_k, offset=offset, filters=filters)
+
+        def lines():
+            rank = offset
+            for results in chunks:
+                body = []
+                for result in results:
+                    rank += 1
+                    body.append(json.dumps({'rank': rank, **result}))
+                body.append('')
+                yield '\n'.join(body)
+
+        return StreamingHttpResponse(lines(), content_type='application/x-ndjson')
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncQueryProcessingView(View):
+    """
+    Async counterpart of QueryProcessingView for ASGI deployments.
+
+    Index freshness is checked with the async ORM on the event loop. With
+    ``QUERY_BATCHING_ENABLED`` the BERT encode is awaited through the encode
+    batcher, so only scoring (and the cheap TF-IDF transform) runs on the
+    bounded query thread pool; requests beyond its queue depth are rejected
+    with 503 instead of queueing behind slow ones.
+    """
+
+    async def post(self, request):
+        from .query_processing.embedding_index import embedding_index
+        from .query_processing.executor import QueryPoolFull, run_in_query_pool
+        from .query_processing.process_query import aencode_bert_query, process_query
+
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({"error": "Request body must be JSON"}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(data, dict):
+            return JsonResponse({"error": "Request body must be a JSON object"}, status=status.HTTP_400_BAD_REQUEST)
+
+        query_text, error = parse_query_text(data)
+        if error:
+            return JsonResponse({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+
+        top_k, offset, error = parse_pagination(data)
+        if error:
+            return JsonResponse({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+        filters, error = parse_filters(data.get('filters'))
+        if error:
+            return JsonResponse({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+
+        await embedding_index.aget()
+        if settings.QUERY_BATCHING_ENABLED:
+            await aencode_bert_query(query_text)
+        try:
+            results = await run_in_query_pool(process_query, query_text, top_k=top_k, offset=offset,
+                                              filters=filters)
+        except QueryPoolFull:
+            return JsonResponse({"error": "Too many concurrent queries, retry shortly"},
+                                status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        return JsonResponse(results, safe=False, status=status.HTTP_200_OK)
+
+class ReadinessView(APIView):
+    def get(self, request):
+        report = readiness()
+        return Response(report, status=status.HTTP_200_OK if report['ready'] else status.HTTP_503_SERVICE_UNAVAILABLE)
\ No newline at end of file